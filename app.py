@@ -1,50 +1,233 @@
+import functools
+import math
 import os
 import secrets
 import sqlite3
+import time
 from datetime import datetime
 
-import pyrebase
-import requests
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 from dotenv import load_dotenv
-from threading import Lock
-from flask import Flask, session, render_template, request, redirect, flash
+from flask import (Blueprint, Flask, Response, current_app, session, render_template, request, redirect, flash,
+                   stream_with_context, send_file, url_for, abort, g, make_response)
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, SubmitField, PasswordField, EmailField
 from wtforms.validators import DataRequired, Email, Length
-from werkzeug.utils import secure_filename
 from flask_restx import Api, Resource, Namespace, fields
+from markupsafe import Markup
+from sqlalchemy import text
+from werkzeug.local import LocalProxy
+
+from auth_cache import ApiKeyCache, ApiUser
+from avatar_cache import AvatarCache
+from batch import OPERATIONS, apply_note_batch
+from export import gzip_chunks, ndjson_chunks
+from firebase_client import Firebase, LazyAuth
+from http_client import HttpClient
+from id_tokens import IdTokenVerifier, SigningKeyCache, SigningKeysUnavailable, VerifiedAccountCache, decode_claims
+from jobs import JobQueue, PermanentJobError
+from live import UsageBroadcaster
+from metrics import Metrics, RequestProfiler
+from migrations import check_version
+from note_cache import NoteListCache
+from pagination import decode_cursor, keyset_page, parse_fields, parse_limit
+from profile_pics import FirebaseStorageBackend, LocalStorageBackend, ProfilePicCache, ProfilePicUploader
+from rate_limit import MemoryBucketStore, RateLimiter, RedisBucketStore
+from search import highlight, search_notes
+from timeseries import RESOLUTIONS, UsageSeries
+from serializers import Serializers, sql_date
+from sync import changes_since
+import sqlite_tuning
+from usage import UsageCounter
+
+db = SQLAlchemy()
+pages = Blueprint('pages', __name__)
+
+
+def extension(name):
+    """Proxy to the ``name`` object of the current app, see create_app()."""
+    return LocalProxy(lambda: current_app.extensions['paw'][name])
+
+
+# Every app gets its own instances, so two apps in one process never share buffers, caches or workers.
+http = extension('http')
+firebase = extension('firebase')
+auth = extension('auth')
+id_tokens = extension('id_tokens')
+verified_accounts = extension('verified_accounts')
+socketio = extension('socketio')
+metrics = extension('metrics')
+profile_pics = extension('profile_pics')
+profile_pic_uploader = extension('profile_pic_uploader')
+avatar_cache = extension('avatar_cache')
+rate_limiter = extension('rate_limiter')
+note_list_cache = extension('note_list_cache')
+usage_counter = extension('usage_counter')
+usage_series = extension('usage_series')
+api_key_cache = extension('api_key_cache')
+jobs = extension('jobs')
+usage_broadcaster = extension('usage_broadcaster')
+
+
+def load_config():
+    load_dotenv()
+    return {
+        'FIREBASE_CONFIG': {
+            "apiKey": os.getenv("API_KEY"),
+            "authDomain": os.getenv("AUTH_DOMAIN"),
+            "databaseURL": os.getenv("DATABASE_URL"),
+            "projectId": os.getenv("PROJECT_ID"),
+            "storageBucket": os.getenv("STORAGE_BUCKET"),
+            "messagingSenderId": os.getenv("MESSAGING_SENDER_ID"),
+            "appId": os.getenv("APP_ID")
+        },
+        'SECRET_KEY': os.getenv("SECRET_KEY"),
+        'SQLALCHEMY_DATABASE_URI': os.getenv("SQLALCHEMY_DATABASE_URI"),
+        'SQLITE_PROFILE': os.getenv("SQLITE_PROFILE", "production"),
+        'SQLITE_POOL_SIZE': int(os.getenv("SQLITE_POOL_SIZE", 10)),
+        'SQLITE_MAX_OVERFLOW': int(os.getenv("SQLITE_MAX_OVERFLOW", 20)),
+        'MAX_CONTENT_LENGTH': 4 * 1024 * 1024,
+        'API_DOCS_ENABLED': os.getenv("API_DOCS_ENABLED", "1") == "1",
+        'API_COMPRESS_MIN_SIZE': int(os.getenv("API_COMPRESS_MIN_SIZE", 1024)),
+        'USAGE_FLUSH_INTERVAL': float(os.getenv("USAGE_FLUSH_INTERVAL", 5)),
+        'USAGE_FLUSH_THRESHOLD': int(os.getenv("USAGE_FLUSH_THRESHOLD", 100)),
+        'API_KEY_CACHE_SIZE': int(os.getenv("API_KEY_CACHE_SIZE", 1024)),
+        'API_KEY_CACHE_TTL': float(os.getenv("API_KEY_CACHE_TTL", 30)),
+        'VERIFIED_ACCOUNT_CACHE_SIZE': int(os.getenv("VERIFIED_ACCOUNT_CACHE_SIZE", 10000)),
+        'NOTES_PAGE_SIZE': int(os.getenv("NOTES_PAGE_SIZE", 100)),
+        'NOTES_MAX_PAGE_SIZE': int(os.getenv("NOTES_MAX_PAGE_SIZE", 1000)),
+        'NOTES_EXPORT_CHUNK_SIZE': int(os.getenv("NOTES_EXPORT_CHUNK_SIZE", 500)),
+        'NOTES_BATCH_MAX_SIZE': int(os.getenv("NOTES_BATCH_MAX_SIZE", 500)),
+        'NOTE_FRAGMENT_CACHE_SIZE': int(os.getenv("NOTE_FRAGMENT_CACHE_SIZE", 1024)),
+        'ASYNC_DB_POOL_SIZE': int(os.getenv("ASYNC_DB_POOL_SIZE", 4)),
+        'WEBSOCKET_MAX_RATE': float(os.getenv("WEBSOCKET_MAX_RATE", 1)),
+        'WEBSOCKET_RATE_WINDOW': int(os.getenv("WEBSOCKET_RATE_WINDOW", 10)),
+        'PROFILE_PIC_CACHE_TTL': float(os.getenv("PROFILE_PIC_CACHE_TTL", 3600)),
+        'PROFILE_PIC_TIMEOUT': float(os.getenv("PROFILE_PIC_TIMEOUT", 3)),
+        'PROFILE_PIC_LOCAL_ROOT': os.getenv("PROFILE_PIC_LOCAL_ROOT"),
+        'PROFILE_PIC_MAX_SIZE': int(os.getenv("PROFILE_PIC_MAX_SIZE", 512)),
+        'PROFILE_PIC_THUMB_SIZE': int(os.getenv("PROFILE_PIC_THUMB_SIZE", 64)),
+        'PROFILE_PIC_WORKERS': int(os.getenv("PROFILE_PIC_WORKERS", 2)),
+        'AVATAR_CACHE_DIR': os.getenv("AVATAR_CACHE_DIR"),
+        'AVATAR_CACHE_MAX_BYTES': int(os.getenv("AVATAR_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        'AVATAR_CACHE_MAX_AGE': int(os.getenv("AVATAR_CACHE_MAX_AGE", 300)),
+        'USE_X_SENDFILE': os.getenv("USE_X_SENDFILE") == "1",
+        'HTTP_POOL_SIZE': int(os.getenv("HTTP_POOL_SIZE", 10)),
+        'HTTP_CONNECT_TIMEOUT': float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05)),
+        'HTTP_READ_TIMEOUT': float(os.getenv("HTTP_READ_TIMEOUT", 10)),
+        'HTTP_RETRIES': int(os.getenv("HTTP_RETRIES", 2)),
+        'HTTP_BACKOFF': float(os.getenv("HTTP_BACKOFF", 0.3)),
+        'RATE_LIMIT_ENABLED': os.getenv("RATE_LIMIT_ENABLED", "1") == "1",
+        'RATE_LIMIT_RATE': float(os.getenv("RATE_LIMIT_RATE", 10)),
+        'RATE_LIMIT_BURST': int(os.getenv("RATE_LIMIT_BURST", 20)),
+        'RATE_LIMIT_REDIS_URL': os.getenv("RATE_LIMIT_REDIS_URL"),
+        'METRICS_ENABLED': os.getenv("METRICS_ENABLED", "1") == "1",
+        'JOBS_WORKERS': int(os.getenv("JOBS_WORKERS", 2)),
+        'JOBS_MAX_ATTEMPTS': int(os.getenv("JOBS_MAX_ATTEMPTS", 5)),
+        'JOBS_RETRY_BACKOFF': float(os.getenv("JOBS_RETRY_BACKOFF", 2)),
+        'JOBS_DRAIN_TIMEOUT': float(os.getenv("JOBS_DRAIN_TIMEOUT", 10)),
+        'USAGE_SERIES_FLUSH_INTERVAL': float(os.getenv("USAGE_SERIES_FLUSH_INTERVAL", 10)),
+        'USAGE_MINUTE_RETENTION_DAYS': float(os.getenv("USAGE_MINUTE_RETENTION_DAYS", 2)),
+        'USAGE_HOUR_RETENTION_DAYS': float(os.getenv("USAGE_HOUR_RETENTION_DAYS", 90)),
+        'USAGE_DAY_RETENTION_DAYS': float(os.getenv("USAGE_DAY_RETENTION_DAYS", 730)),
+        'ADMIN_EMAILS': {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",")
+                         if email.strip()},
+    }
+
+
+def create_app(config=None):
+    """Build the application. ``config`` overrides the settings read from the environment and ``.env``."""
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', sqlite_tuning.engine_options(
+        app.config['SQLITE_PROFILE'],
+        pool_size=app.config['SQLITE_POOL_SIZE'],
+        max_overflow=app.config['SQLITE_MAX_OVERFLOW'],
+    ))
+
+    db.init_app(app)
+    http = HttpClient()
+    firebase = Firebase(http)
+    socketio = SocketIO(cors_allowed_origins='*')
+    profile_pics = ProfilePicCache()
+    rate_limiter = RateLimiter()
+    jobs = JobQueue(db)
+    extensions = app.extensions['paw'] = {
+        'http': http,
+        'firebase': firebase,
+        'auth': LazyAuth(firebase),
+        'id_tokens': IdTokenVerifier(SigningKeyCache(http)),
+        'verified_accounts': VerifiedAccountCache(),
+        'socketio': socketio,
+        'metrics': Metrics(http),
+        'profile_pics': profile_pics,
+        'profile_pic_uploader': ProfilePicUploader(profile_pics, db),
+        'avatar_cache': AvatarCache(profile_pics),
+        'rate_limiter': rate_limiter,
+        'note_list_cache': NoteListCache(),
+        'usage_counter': UsageCounter(db, User),
+        'usage_series': UsageSeries(db),
+        'api_key_cache': ApiKeyCache(),
+        'jobs': jobs,
+        'usage_broadcaster': UsageBroadcaster(socketio),
+    }
+
+    socketio.init_app(app)
+    socketio.on_event('connect', connect)
+    socketio.on_event('disconnect', disconnect)
+    for name in ('http', 'firebase', 'id_tokens', 'verified_accounts'):
+        extensions[name].init_app(app)
+    with app.app_context():
+        sqlite_tuning.install(db.engine, app.config['SQLITE_PROFILE'])
+        connection = db.engine.raw_connection()
+        try:
+            check_version(connection.driver_connection)
+        finally:
+            connection.close()
+        extensions['metrics'].init_app(app, db.engine)
+    request_profiler.init_app(app)
+
+    if app.config['PROFILE_PIC_LOCAL_ROOT']:
+        profile_pics.backend = LocalStorageBackend(app.config['PROFILE_PIC_LOCAL_ROOT'])
+    else:
+        profile_pics.backend = FirebaseStorageBackend(firebase, app.config['FIREBASE_CONFIG']['storageBucket'],
+                                                      http, timeout=app.config['PROFILE_PIC_TIMEOUT'])
 
-load_dotenv()
+    if app.config['RATE_LIMIT_REDIS_URL']:
+        import redis
+        rate_limiter.store = RedisBucketStore(redis.Redis.from_url(app.config['RATE_LIMIT_REDIS_URL']))
+    else:
+        rate_limiter.store = MemoryBucketStore()
 
-firebase_config = {
-    "apiKey": os.getenv("API_KEY"),
-    "authDomain": os.getenv("AUTH_DOMAIN"),
-    "databaseURL": os.getenv("DATABASE_URL"),
-    "projectId": os.getenv("PROJECT_ID"),
-    "storageBucket": os.getenv("STORAGE_BUCKET"),
-    "messagingSenderId": os.getenv("MESSAGING_SENDER_ID"),
-    "appId": os.getenv("APP_ID")
-}
+    for name, task in TASKS.items():
+        jobs.task(name)(task)
+
+    for name in ('profile_pics', 'profile_pic_uploader', 'avatar_cache', 'rate_limiter', 'note_list_cache',
+                 'usage_counter', 'usage_series', 'api_key_cache', 'usage_broadcaster', 'jobs'):
+        extensions[name].init_app(app)
 
-firebase = pyrebase.initialize_app(firebase_config)
-auth = firebase.auth()
-storage = firebase.storage()
+    app.register_blueprint(pages)
+    serializers.init_app(app, api)
+    # The Swagger spec is only generated when /swagger.json is first requested.
+    api.init_app(app, add_specs=app.config['API_DOCS_ENABLED'])
+    return app
 
-thread = None
-thread_lock = Lock()
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
-app.secret_key = os.getenv("SECRET_KEY")
-app.config['MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024
-db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins='*')
+def is_admin():
+    email = session.get('user')
+    if email is None:
+        user = verify_api_key(request.args.get('api_key'))
+        email = user.email if user else None
+    return email is not None and email.lower() in current_app.config['ADMIN_EMAILS']
 
 
-@app.route('/', methods=['POST', 'GET'])
+request_profiler = RequestProfiler(is_admin)
+
+
+@pages.route('/', methods=['POST', 'GET'])
 def login():
     email = None
     password = None
@@ -54,15 +237,18 @@ def login():
         password = form.password.data
         try:
             user = auth.sign_in_with_email_and_password(email, password)
-            acc_info = auth.get_account_info(user['idToken'])
-            if acc_info['users'][0]['emailVerified']:
+            claims = verify_id_token(user['idToken'])
+            if verified_accounts.email_verified(
+                    claims['sub'], claims,
+                    lambda: auth.get_account_info(user['idToken'])['users'][0]['emailVerified']):
                 session['user'] = email
                 session['name'] = create_name(email)
                 session['idToken'] = user['idToken']
+                session['idTokenExpires'] = claims['exp']
                 user = User.query.filter_by(email=session['user']).first()
                 user_id = user.user_id
-                if requests.get(
-                        f"https://firebasestorage.googleapis.com/v0/b/paw-1-32b63.appspot.com/o/images%2Fprofile_pic_{user_id}.jpg?alt=media").status_code == 200:
+                session['uid'] = user_id
+                if profile_pics.exists(user_id):
                     session['user_id'] = user_id
                 else:
                     session['user_id'] = None
@@ -78,27 +264,92 @@ def login():
                 flash("Podałeś błędne hasło lub takie konto z takim adresem email nie istnieje.")
 
     if 'user' in session:
-        user = User.query.filter_by(email=session['user']).first()
-        user_id = user.user_id
-        if user:
-            our_notes = Note.query.filter_by(user_id=user_id).all()
-        else:
-            return "Błąd"
-        return render_template('index.html', our_notes=our_notes)
+        report_profile_pic_upload()
+        user_id = session.get('uid')
+        if user_id is None:
+            user = User.query.filter_by(email=session['user']).first()
+            if not user:
+                return "Błąd"
+            user_id = session['uid'] = user.user_id
+        etag = None
+        version = note_list_version(user_id)
+        if request.method == 'GET' and '_flashes' not in session:
+            etag = note_list_cache.etag(user_id, version, session.get('name'), session.get('user_id'))
+            if request.if_none_match.contains(etag):
+                response = make_response(('', 304))
+                response.set_etag(etag)
+                return response
+        response = make_response(render_notes(user_id, version))
+        if etag:
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
 
     return render_template('login.html', email=email, password=password, form=form)
 
 
-api = Api(app, doc="/docs/", title="Note App Api", version="0.4")
+def verify_id_token(id_token):
+    """Claims of a token from sign-in, verified locally or, without signing keys, by Firebase Auth."""
+    try:
+        return id_tokens.verify(id_token)
+    except SigningKeysUnavailable:
+        current_app.logger.warning("Verifying the ID token with Firebase Auth, no signing keys", exc_info=True)
+    account = auth.get_account_info(id_token)['users'][0]
+    return {**decode_claims(id_token), 'sub': account['localId'], 'email_verified': account['emailVerified']}
+
+
+def note_list_version(user_id):
+    # Read before the notes themselves, see NoteListCache.
+    return db.session.execute(NOTE_LIST_VERSION, {'user_id': user_id}).scalar() or 0
+
+
+def render_notes(user_id, version=None, **context):
+    if version is None:
+        version = note_list_version(user_id)
+    notes_table = note_list_cache.fragment(user_id, version, lambda: Markup(render_template(
+        'notes_table.html', our_notes=Note.query.filter_by(user_id=user_id).all())))
+    return render_template('index.html', notes_table=notes_table, **context)
+
 
-ns = Namespace("notes", description="Everything about notes")
+def rate_limited(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        user = g.get('api_user')
+        if user and rate_limiter.enabled:
+            g.rate_limit = rate_limiter.hit(request.args['api_key'], user.rate_limit, user.rate_burst)
+            if g.rate_limit and not g.rate_limit.allowed:
+                ns.abort(429, 'Rate limit exceeded')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+api = Api(doc="/docs/", title="Note App Api", version="0.4")
+
+serializers = Serializers()
+ns = Namespace("notes", description="Everything about notes", decorators=[rate_limited])
 api.add_namespace(ns)
+stats_ns = Namespace("stats", description="API usage statistics", decorators=[rate_limited])
+api.add_namespace(stats_ns)
+
+NOTE_FIELDS = ('id', 'title', 'text', 'date_added')
 
 note_model = api.model("Note", {
     'title': fields.String(description="Title of note", required=True),
     'text': fields.String(description="Text of note", required=True),
 })
 
+batch_operation_model = api.model("NoteOperation", {
+    'op': fields.String(description="Operation", required=True, enum=list(OPERATIONS)),
+    'id': fields.Integer(description="ID of note (update and delete)"),
+    'title': fields.String(description="Title of note (create and update)"),
+    'text': fields.String(description="Text of note (create and update)"),
+})
+
+batch_model = api.model("NoteBatch", {
+    'operations': fields.List(fields.Nested(batch_operation_model), required=True),
+})
+
 
 class LoginForm(FlaskForm):
     email = EmailField('Adres email ', validators=[DataRequired(), Email()])
@@ -120,6 +371,10 @@ class ForgotForm(FlaskForm):
     send = SubmitField('Wyślij')
 
 
+class ApiKeyForm(FlaskForm):
+    regenerate = SubmitField('Wygeneruj nowy klucz')
+
+
 class ProfilePicForm(FlaskForm):
     profile_pic = FileField('Zdjęcie profilowe',
                             validators=[FileAllowed(['jpg', 'png'], 'Tylko zdjęcia!'), FileRequired()])
@@ -128,21 +383,60 @@ class ProfilePicForm(FlaskForm):
 
 class Note(db.Model):
     __tablename__ = 'note'
+    __table_args__ = (db.Index('ix_note_user_date', 'user_id', 'date_added', 'id'),
+                      db.Index('ix_note_user_revision', 'user_id', 'revision'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user_info.user_id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     text = db.Column(db.Text, nullable=False)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set by the note_sync_* triggers (see sync.py).
+    updated_at = db.Column(db.DateTime, server_default=db.FetchedValue(), server_onupdate=db.FetchedValue())
+    revision = db.Column(db.Integer, server_default=db.FetchedValue(), server_onupdate=db.FetchedValue())
 
 
 class User(db.Model):
     __tablename__ = 'user_info'
     user_id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False)
-    api_key = db.Column(db.String(255), nullable=False)
+    api_key = db.Column(db.String(255), unique=True, index=True, nullable=False)
     notes = db.relationship('Note', backref='user', lazy=True)
     total_requests = db.Column(db.Integer, default=0)
     last_request_timestamp = db.Column(db.DateTime)
+    rate_limit = db.Column(db.Float)
+    rate_burst = db.Column(db.Integer)
+    change_seq = db.Column(db.Integer, server_default=db.FetchedValue())
+
+
+NOTE_LIST_VERSION = text("SELECT change_seq FROM user_info WHERE user_id = :user_id")
+
+# Firebase errors that will not go away by sending the same request again.
+PERMANENT_AUTH_ERRORS = ('EMAIL_NOT_FOUND', 'INVALID_ID_TOKEN', 'USER_NOT_FOUND', 'USER_DISABLED')
+
+
+def call_auth(method, *args):
+    """Call a Firebase Auth method from a job; errors in PERMANENT_AUTH_ERRORS fail the job without retries."""
+    try:
+        return method(*args)
+    except Exception as e:
+        if any(error in str(e) for error in PERMANENT_AUTH_ERRORS):
+            raise PermanentJobError(e)
+        raise
+
+
+def send_email_verification(id_token):
+    call_auth(auth.send_email_verification, id_token)
+
+
+def send_password_reset_email(email):
+    call_auth(auth.send_password_reset_email, email)
+
+
+# Registered on the JobQueue of every app by create_app().
+TASKS = {
+    'send_email_verification': send_email_verification,
+    'send_password_reset_email': send_password_reset_email,
+}
 
 
 class NoteForm(FlaskForm):
@@ -151,7 +445,23 @@ class NoteForm(FlaskForm):
     save = SubmitField("Zapisz")
 
 
-@app.route('/add', methods=['GET', 'POST'])
+@pages.route('/search')
+def search():
+    if 'user' not in session:
+        return redirect('/')
+    query = request.args.get('q', '').strip()
+    if not query:
+        return redirect('/')
+    user = User.query.filter_by(email=session['user']).first()
+    if not user:
+        return "Błąd"
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    our_notes, next_offset = search_notes(db.session, user.user_id, query,
+                                          current_app.config['NOTES_PAGE_SIZE'], offset)
+    return render_template('index.html', our_notes=our_notes, query=query, next_offset=next_offset)
+
+
+@pages.route('/add', methods=['GET', 'POST'])
 def add_note():
     form = NoteForm()
     user = User.query.filter_by(email=session['user']).first()
@@ -162,12 +472,8 @@ def add_note():
             db.session.commit()
             form.title.data = ''
             form.text.data = ''
-            if user:
-                our_notes = Note.query.filter_by(user_id=user.user_id).all()
-            else:
-                return "Błąd"
             flash("Dodano notatkę!")
-            return render_template("index.html", our_notes=our_notes)
+            return render_notes(user.user_id)
         except Exception as e:
             print(e)
             flash("Wystąpił błąd")
@@ -175,7 +481,7 @@ def add_note():
                            form=form)
 
 
-@app.route('/edit/<int:id>', methods=['GET', 'POST'])
+@pages.route('/edit/<int:id>', methods=['GET', 'POST'])
 def edit_note(id):
     form = NoteForm()
     user = User.query.filter_by(email=session['user']).first()
@@ -183,15 +489,12 @@ def edit_note(id):
     if request.method == "POST":
         note_to_update.title = request.form['title']
         note_to_update.text = request.form['text']
-        if user:
-            our_notes = Note.query.filter_by(user_id=user.user_id).all()
-        else:
+        if not user:
             return "Błąd"
         try:
             db.session.commit()
             flash("Zmodyfikowano notatkę.")
-            return render_template("index.html",
-                                   our_notes=our_notes)
+            return render_notes(user.user_id)
         except Exception as e:
             print(e)
             flash("Wystąpił błąd")
@@ -201,7 +504,7 @@ def edit_note(id):
                                note_to_update=note_to_update)
 
 
-@app.route('/delete/<int:id>', methods=['GET', 'POST'])
+@pages.route('/delete/<int:id>', methods=['GET', 'POST'])
 def delete_note(id):
     note_to_delete = Note.query.get_or_404(id)
     try:
@@ -213,12 +516,9 @@ def delete_note(id):
         flash("Wystąpił błąd")
     finally:
         user = User.query.filter_by(email=session['user']).first()
-        if user:
-            our_notes = Note.query.filter_by(user_id=user.user_id).all()
-        else:
+        if not user:
             return "Błąd"
-        return render_template("index.html",
-                               our_notes=our_notes)
+        return render_notes(user.user_id)
 
 
 def create_name(email):
@@ -234,14 +534,14 @@ def generate_api_key():
     return api_key
 
 
-@app.route('/logout')
+@pages.route('/logout')
 def logout():
     if 'user' in session:
         session.clear()
     return redirect('/')
 
 
-@app.route('/signup', methods=['POST', 'GET'])
+@pages.route('/signup', methods=['POST', 'GET'])
 def signup():
     form = RegisterForm()
     if 'user' in session:
@@ -259,9 +559,11 @@ def signup():
                 try:
                     db.session.add(user_info)
                     db.session.commit()
+                    api_key_cache.invalidate(user_info.api_key)
                 except sqlite3.IntegrityError as e:
                     print(e)
-                auth.send_email_verification(user['idToken'])
+                jobs.enqueue('send_email_verification', {'id_token': user['idToken']},
+                             key=f"email-verification:{user['localId']}")
                 flash("Utworzono konto, potwierdź je na mailu.")
                 return render_template('login.html', form=LoginForm())
             except Exception as e:
@@ -274,63 +576,102 @@ def signup():
     return render_template('signup.html', email=email, password=password, form=form)
 
 
-@app.route('/forgot', methods=['POST', 'GET'])
+@pages.route('/forgot', methods=['POST', 'GET'])
 def forgot():
     email = None
     form = ForgotForm()
     if form.validate_on_submit():
         email = form.email.data
         try:
-            auth.send_password_reset_email(email)
-            flash("Na email zostały wysłane dalsze instrukcje.")
+            # Repeated requests within five minutes send a single email.
+            jobs.enqueue('send_password_reset_email', {'email': email},
+                         key=f"password-reset:{email.lower()}:{int(time.time() // 300)}")
+            flash("Jeśli konto z takim adresem email istnieje, na email zostały wysłane dalsze instrukcje.")
         except Exception as e:
-            if "EMAIL_NOT_FOUND" in str(e):
-                flash("Nie istnieje konto z takim adresem email.")
+            print(e)
+            flash("Wystąpił błąd")
 
     return render_template('forgot.html', email=email, form=form)
 
 
-@app.route('/settings', methods=['POST', 'GET'])
+@pages.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    status = jobs.status(job_id) if is_admin() else None
+    if status is None:
+        return {'message': 'Job not found'}, 404
+    return status
+
+
+@pages.route('/settings', methods=['POST', 'GET'])
 def update_profile_pic():
     form = ProfilePicForm()
     user = User.query.filter_by(email=session['user']).first()
 
     api_key = user.api_key
     if form.validate_on_submit():
+        if session.get('idTokenExpires', 0) <= time.time():
+            session.clear()
+            flash("Sesja wygasła, zaloguj się ponownie.")
+            return redirect('/')
         try:
-            pic_data = form.profile_pic.data
-            filename = secure_filename(pic_data.filename)
-            pic_data.save(os.path.join(app.instance_path, filename))
-            user = User.query.filter_by(email=session['user']).first()
-            user_id = user.user_id
-            storage.child(f"images/profile_pic_{user_id}.jpg").put(f"instance/{filename}", session['idToken'])
-            response = requests.get(f"https://firebasestorage.googleapis.com/v0/b/paw-1-32b63.appspot.com/o/images%2Fprofile_pic_{user_id}.jpg?alt=media")
-            if response.status_code == 200:
-                session['user_id'] = user_id
-            else:
-                session['user_id'] = None
-
-            os.remove(f"{app.instance_path}/{filename}")
-            flash("Dodano zdjęcie!")
+            profile_pic_uploader.submit(user.user_id, form.profile_pic.data.stream, session['idToken'])
+            session['pic_upload'] = user.user_id
+            flash("Zdjęcie jest wysyłane, pojawi się za chwilę.")
         except Exception as e:
             print(e)
             flash("Wystąpił błąd")
-
-    return render_template('settings.html', form=form, api_key=api_key)
+    else:
+        report_profile_pic_upload()
+
+    return render_template('settings.html', form=form, api_key=api_key, api_key_form=ApiKeyForm())
+
+
+def report_profile_pic_upload():
+    """Flash the result of the profile picture upload started by this session once it is known."""
+    user_id = session.get('pic_upload')
+    if user_id is None:
+        return
+    result = profile_pic_uploader.result(user_id)
+    if result is None or result[0] != 'uploading':
+        session.pop('pic_upload')
+    if result is None:
+        return
+    if result[0] == 'done':
+        session['user_id'] = user_id
+        flash("Dodano zdjęcie!")
+    elif result[0] == 'failed':
+        flash("Nie udało się wysłać zdjęcia, spróbuj ponownie.")
+
+
+@pages.route('/regenerate_api_key', methods=['POST'])
+def regenerate_api_key():
+    form = ApiKeyForm()
+    if 'user' not in session:
+        return "Najpierw się zaloguj!"
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=session['user']).first()
+        old_api_key = user.api_key
+        try:
+            user.api_key = generate_api_key()
+            db.session.commit()
+            api_key_cache.invalidate(old_api_key)
+            flash("Wygenerowano nowy klucz API.")
+        except Exception as e:
+            print(e)
+            flash("Wystąpił błąd")
+    return redirect('/settings')
 
 
-@app.route('/download_profile_pic', methods=['POST', 'GET'])
+@pages.route('/download_profile_pic', methods=['POST', 'GET'])
 def download_profile_pic():
     form = ProfilePicForm()
     try:
         user = User.query.filter_by(email=session['user']).first()
         user_id = user.user_id
-        response = requests.get(
-            f"https://firebasestorage.googleapis.com/v0/b/paw-1-32b63.appspot.com/o/images%2Fprofile_pic_{user_id}.jpg?alt=media")
-        if response.status_code == 200:
-            storage.child(f"images/profile_pic_{user_id}.jpg").download(path="",
-                                                                        filename="static/your_profile_pic.jpg")
+        if avatar_cache.get(user_id):
             flash("Pobrano zdjęcie!")
+            return render_template('settings.html', form=form,
+                                   download_url=url_for('pages.avatar', user_id=user_id, download=1))
         else:
             flash("Nie masz swojego zdjęcia!")
     except Exception as e:
@@ -339,61 +680,252 @@ def download_profile_pic():
     return render_template('settings.html', form=form)
 
 
-@app.before_request
+@pages.route('/avatar/<int:user_id>')
+def avatar(user_id):
+    # Pictures uploaded before thumbnails existed fall back to the full size one.
+    variants = ('thumb', None) if request.args.get('size') == 'thumb' else (None,)
+    cached = None
+    for variant in variants:
+        try:
+            cached = avatar_cache.get(user_id, variant)
+        except Exception as e:
+            print(e)
+        if cached is not None:
+            break
+    if cached is None:
+        abort(404)
+    path, digest = cached
+    response = send_file(path, mimetype='image/jpeg', etag=digest, max_age=avatar_cache.max_age,
+                         as_attachment='download' in request.args,
+                         download_name=f"profile_pic_{user_id}.jpg")
+    response.cache_control.public = True
+    return response
+
+
+@pages.before_app_request
 def update_user_stats():
     api_key = request.args.get('api_key')
-    if api_key:
-        user = User.query.filter_by(api_key=api_key).first()
-        if user:
-            user.total_requests += 1
-            user.last_request_timestamp = datetime.now()
-            db.session.commit()
+    user = g.api_user = verify_api_key(api_key) if api_key else None
+    if user:
+        usage_counter.record(user.user_id)
+        usage_series.record(user.user_id)
+        usage_broadcaster.increment(user.user_id)
 
 
-def verify_api_key(api_key):
+@pages.after_app_request
+def add_rate_limit_headers(response):
+    limit = g.get('rate_limit')
+    if limit:
+        response.headers.extend(rate_limiter.headers(limit))
+    return response
+
+
+def load_api_user(api_key):
     user = User.query.filter_by(api_key=api_key).first()
-    if api_key is None:
+    if user is None:
         return None
-    if api_key != user.api_key:
+    return ApiUser(user.user_id, user.email, user.rate_limit, user.rate_burst)
+
+
+def verify_api_key(api_key):
+    if api_key is None:
         return None
-    else:
-        return user
+    return api_key_cache.get(api_key, load_api_user)
 
 
 @ns.response(200, "Success")
 @ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
 @ns.response(404, "Notes doesn't exist")
 @ns.route("")
 @ns.param('api_key', 'Api Key')
 class JsonAllNotes(Resource):
 
+    @ns.param('limit', 'Maximum number of notes to return')
+    @ns.param('cursor', 'Cursor returned as next_cursor by the previous page')
+    @ns.param('fields', 'Comma separated list of fields: id, title, text, date_added')
+    @ns.response(400, "Invalid pagination parameters")
     def get(self):
         api_key = request.args.get('api_key')
         user = verify_api_key(api_key)
         if user:
-            notes = Note.query.filter_by(user_id=user.user_id).all()
+            etag = note_list_cache.etag(user.user_id, note_list_version(user.user_id), request.query_string,
+                                        serializers.mediatype())
+            if request.if_none_match.contains_weak(etag):
+                return Response(status=304, headers={'ETag': f'"{etag}"'})
+            try:
+                limit = parse_limit(request.args.get('limit'), current_app.config['NOTES_PAGE_SIZE'],
+                                    current_app.config['NOTES_MAX_PAGE_SIZE'])
+                fields = parse_fields(request.args.get('fields'), NOTE_FIELDS)
+                cursor = request.args.get('cursor')
+                cursor = decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            columns = [getattr(Note, field) for field in NOTE_FIELDS if field in fields or field == 'id']
+            query = db.session.query(*columns, sql_date(Note.date_added).label('date_text')) \
+                .filter(Note.user_id == user.user_id)
+            notes, next_cursor = keyset_page(query, Note.date_added, Note.id, cursor, limit)
             output = []
             for note in notes:
-                note_data = {
-                    'id': note.id, 'title': note.title, 'text': note.text,
-                    'date_added': note.date_added.strftime('%Y-%m-%d %H:%M:%S')
-                }
+                note_data = {field: getattr(note, field) for field in fields}
+                if 'date_added' in note_data:
+                    note_data['date_added'] = note.date_text
                 output.append(note_data)
-            return {'notes': output}
+            return {'notes': output, 'next_cursor': next_cursor}, 200, {'ETag': f'"{etag}"',
+                                                                        'Cache-Control': 'private, no-cache'}
         else:
             return {'message': 'Unauthorized api key'}, 401
 
     @ns.expect(note_model)
-    @ns.marshal_with(note_model, code=200)
+    @ns.response(200, "Success", note_model)
     def post(self):
         api_key = request.args.get('api_key')
         user = verify_api_key(api_key)
         if user:
-            user = User.query.filter_by(api_key=api_key).first()
             note = Note(title=ns.payload["title"], text=ns.payload["text"], user_id=user.user_id)
             db.session.add(note)
             db.session.commit()
-            return note
+            return {'title': note.title, 'text': note.text}
+        else:
+            return {'message': 'Unauthorized api key'}, 401
+
+
+@ns.response(200, "Success")
+@ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
+@ns.route("/export")
+@ns.param('api_key', 'Api Key')
+@ns.param('gzip', 'Compress the stream with gzip (1/0)')
+class NotesExport(Resource):
+
+    @ns.produces(['application/x-ndjson'])
+    def get(self):
+        api_key = request.args.get('api_key')
+        user = verify_api_key(api_key)
+        if user:
+            columns = [sql_date(Note.date_added).label(field) if field == 'date_added' else getattr(Note, field)
+                       for field in NOTE_FIELDS]
+            result = db.session.execute(
+                db.select(*columns)
+                .where(Note.user_id == user.user_id)
+                .order_by(Note.id)
+                .execution_options(yield_per=current_app.config['NOTES_EXPORT_CHUNK_SIZE'])
+            )
+            chunks = ndjson_chunks(result.partitions(), NOTE_FIELDS)
+            headers = {'Content-Disposition': 'attachment; filename=notes.ndjson'}
+            if request.args.get('gzip') in ('1', 'true'):
+                chunks = gzip_chunks(chunks)
+                headers['Content-Encoding'] = 'gzip'
+            return Response(stream_with_context(chunks), mimetype='application/x-ndjson', headers=headers)
+        else:
+            return {'message': 'Unauthorized api key'}, 401
+
+
+@ns.response(200, "Success")
+@ns.response(400, "Invalid batch")
+@ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
+@ns.route("/batch")
+@ns.param('api_key', 'Api Key')
+class NotesBatch(Resource):
+
+    @ns.expect(batch_model)
+    def post(self):
+        api_key = request.args.get('api_key')
+        user = verify_api_key(api_key)
+        if user:
+            operations = ns.payload.get('operations') if isinstance(ns.payload, dict) else None
+            if not isinstance(operations, list):
+                return {'message': 'Operations must be a list'}, 400
+            if len(operations) > current_app.config['NOTES_BATCH_MAX_SIZE']:
+                return {'message': f"At most {current_app.config['NOTES_BATCH_MAX_SIZE']} operations per batch"}, 400
+            try:
+                results = apply_note_batch(db.session, Note, user.user_id, operations)
+                db.session.commit()
+            except Exception as e:
+                print(e)
+                db.session.rollback()
+                return {'message': 'Batch failed'}, 500
+            return {'results': results}
+        else:
+            return {'message': 'Unauthorized api key'}, 401
+
+
+@ns.response(200, "Success")
+@ns.response(400, "Invalid search parameters")
+@ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
+@ns.route("/search")
+@ns.param('api_key', 'Api Key')
+@ns.param('q', 'Words to search for in title and text')
+@ns.param('limit', 'Maximum number of notes to return')
+@ns.param('offset', 'Offset returned as next_offset by the previous page')
+@ns.param('snippets', 'Include snippets as escaped HTML with the matches in <mark> tags (1/0)')
+class NotesSearch(Resource):
+
+    def get(self):
+        api_key = request.args.get('api_key')
+        user = verify_api_key(api_key)
+        if user:
+            query = request.args.get('q', '').strip()
+            offset = request.args.get('offset', 0, type=int)
+            if not query or offset < 0:
+                return {'message': 'Invalid search parameters'}, 400
+            try:
+                limit = parse_limit(request.args.get('limit'), current_app.config['NOTES_PAGE_SIZE'],
+                                    current_app.config['NOTES_MAX_PAGE_SIZE'])
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            snippets = request.args.get('snippets') in ('1', 'true')
+            notes, next_offset = search_notes(db.session, user.user_id, query, limit, offset, snippets)
+            output = []
+            for note in notes:
+                note_data = {
+                    'id': note.id, 'title': note.title, 'text': note.text,
+                    'date_added': note.date_text, 'rank': note.rank
+                }
+                if snippets:
+                    note_data['snippet'] = highlight(note.snippet)
+                output.append(note_data)
+            return {'notes': output, 'next_offset': next_offset}
+        else:
+            return {'message': 'Unauthorized api key'}, 401
+
+
+@ns.response(200, "Success")
+@ns.response(400, "Invalid sync parameters")
+@ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
+@ns.route("/changes")
+@ns.param('api_key', 'Api Key')
+@ns.param('since', 'Sequence number returned as next_since by the previous sync (0 for everything)')
+@ns.param('limit', 'Maximum number of changes to return')
+class NotesChanges(Resource):
+
+    def get(self):
+        api_key = request.args.get('api_key')
+        user = verify_api_key(api_key)
+        if user:
+            since = request.args.get('since', 0, type=int)
+            if since < 0:
+                return {'message': 'Invalid sync parameters'}, 400
+            try:
+                limit = parse_limit(request.args.get('limit'), current_app.config['NOTES_PAGE_SIZE'],
+                                    current_app.config['NOTES_MAX_PAGE_SIZE'])
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            changes, has_more = changes_since(db.session, user.user_id, since, limit)
+            output = []
+            for change in changes:
+                if change.deleted:
+                    output.append({'seq': change.seq, 'op': 'delete', 'id': change.id})
+                else:
+                    output.append({'seq': change.seq, 'op': 'upsert', 'note': {
+                        'id': change.id, 'title': change.title, 'text': change.text,
+                        'date_added': change.date_added, 'updated_at': change.updated_at,
+                    }})
+            next_since = changes[-1].seq if changes else since
+            return {'changes': output, 'next_since': next_since, 'has_more': has_more}
         else:
             return {'message': 'Unauthorized api key'}, 401
 
@@ -401,6 +933,7 @@ class JsonAllNotes(Resource):
 @ns.param("id", "Note ID")
 @ns.response(404, "Note with that ID doesn't exist")
 @ns.response(401, "Unauthorized api key")
+@ns.response(429, "Rate limit exceeded")
 @ns.response(200, "Success")
 @ns.route("/<id>")
 @ns.param('api_key', 'Api Key')
@@ -410,12 +943,10 @@ class JsonOneNote(Resource):
         api_key = request.args.get('api_key')
         user = verify_api_key(api_key)
         if user:
-            note = Note.query.filter_by(user_id=user.user_id, id=id).first()
+            note = db.session.query(Note.id, Note.title, Note.text, sql_date(Note.date_added).label('date_added')) \
+                .filter_by(user_id=user.user_id, id=id).first()
             if note:
-                return {
-                    'id': note.id, 'title': note.title,
-                    'text': note.text, 'date_added': note.date_added.strftime('%Y-%m-%d %H:%M:%S')
-                }
+                return {'id': note.id, 'title': note.title, 'text': note.text, 'date_added': note.date_added}
             else:
                 return {'message': 'Note not found'}, 404
         else:
@@ -436,7 +967,7 @@ class JsonOneNote(Resource):
             return {'message': 'Unauthorized api key'}, 401
 
     @ns.expect(note_model)
-    @ns.marshal_with(note_model)
+    @ns.response(200, "Success", note_model)
     def put(self, id):
         api_key = request.args.get('api_key')
         user = verify_api_key(api_key)
@@ -447,46 +978,66 @@ class JsonOneNote(Resource):
                 note_to_update.title = ns.payload["title"]
                 note_to_update.text = ns.payload["text"]
                 db.session.commit()
-                return note_to_update
+                return {'title': note_to_update.title, 'text': note_to_update.text}
             else:
                 return {'message': 'Note not found'}, 404
         else:
             return {'message': 'Unauthorized api key'}, 401
 
 
-def get_current_datetime():
-    now = datetime.now()
-    return now.strftime("%H:%M:%S")
+@stats_ns.response(200, "Success")
+@stats_ns.response(400, "Invalid range")
+@stats_ns.response(401, "Unauthorized api key")
+@stats_ns.response(429, "Rate limit exceeded")
+@stats_ns.route("")
+@stats_ns.param('api_key', 'Api Key (not needed with a logged in session)')
+@stats_ns.param('start', 'Start of the range, Unix time (default: an hour before end)')
+@stats_ns.param('end', 'End of the range, Unix time (default: now)')
+@stats_ns.param('resolution', 'minute, hour or day (default: the finest one with data for the range)')
+class UsageStats(Resource):
 
-
-def background_thread():
-    while True:
-        sum = 0
-        with app.app_context():
-            users = User.query.all()
-        for user in users:
-            sum += user.total_requests
-        value = sum
-        socketio.emit('updateData', {'value': value, "date": get_current_datetime()})
-        socketio.sleep(5)
+    def get(self):
+        api_key = request.args.get('api_key')
+        if api_key:
+            user = verify_api_key(api_key)
+        else:
+            # The websocket dashboard polls with its session, so the polling is neither counted nor rate limited.
+            user = User.query.filter_by(email=session['user']).first() if 'user' in session else None
+        if user:
+            end = request.args.get('end', time.time(), type=float)
+            start = request.args.get('start', end - 3600, type=float)
+            resolution = request.args.get('resolution') or usage_series.resolution(start, end)
+            if not (math.isfinite(start) and math.isfinite(end)) or start >= end or resolution not in RESOLUTIONS:
+                return {'message': 'Invalid range'}, 400
+            if (end - start) / RESOLUTIONS[resolution] > usage_series.max_points:
+                return {'message': f"At most {usage_series.max_points} points per request"}, 400
+            points = usage_series.query(user.user_id, start, end, resolution)
+            return {'resolution': resolution, 'points': points, 'total': sum(count for _, count in points)}
+        else:
+            return {'message': 'Unauthorized api key'}, 401
 
 
-@app.route('/websocket')
+@pages.route('/websocket')
 def websocket():
     if 'user' in session:
         return render_template('websocket.html')
     return "Najpierw się zaloguj!"
 
 
-@socketio.on('connect')
 def connect():
+    if 'user' not in session:
+        return False
+    user = User.query.filter_by(email=session['user']).first()
+    if not user:
+        return False
     print('Połączono')
+    join_room(usage_broadcaster.room(user.user_id))
+    usage_broadcaster.connect(request.sid, user.user_id)
+
 
-    global thread
-    with thread_lock:
-        if thread is None:
-            thread = socketio.start_background_task(background_thread)
+def disconnect():
+    usage_broadcaster.disconnect(request.sid)
 
 
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
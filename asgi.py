@@ -0,0 +1,266 @@
+"""ASGI twin of the notes API.
+
+``/notes`` and ``/notes/<id>`` are served by async handlers on aiosqlite
+with the same payloads and status codes as the Flask-RESTX resources.
+Every other path, including the rest of the ``notes`` namespace, is passed
+to the Flask application. Run with::
+
+    uvicorn asgi:app
+"""
+import asyncio
+import contextlib
+import functools
+from datetime import datetime
+
+import aiosqlite
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import literal_column
+from sqlalchemy.dialects import sqlite
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import sqlite_tuning
+from app import create_app, db, NOTE_FIELDS
+from auth_cache import ApiUser, MISSING
+from pagination import decode_cursor, encode_cursor, parse_fields, parse_limit
+from serializers import sql_date
+
+# date_added formatted by SQLite with the expression the Flask resources use.
+DATE_TEXT = sql_date(literal_column('date_added')).compile(dialect=sqlite.dialect(),
+                                                          compile_kwargs={'literal_binds': True})
+
+
+class AsyncDatabase:
+    """Small pool of aiosqlite connections using the pragmas of the app's SQLite profile."""
+
+    def __init__(self, path, size=4, pragmas=None):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas or {}
+        self._pool = None
+        self._connections = []
+
+    async def _open(self):
+        self._pool = asyncio.Queue()
+        for _ in range(self.size):
+            connection = await aiosqlite.connect(self.path)
+            connection.row_factory = aiosqlite.Row
+            for name, value in self.pragmas.items():
+                await connection.execute(f"PRAGMA {name} = {value}")
+            self._connections.append(connection)
+            self._pool.put_nowait(connection)
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        if self._pool is None:
+            await self._open()
+        connection = await self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put_nowait(connection)
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+        self._pool = None
+
+
+flask_app = create_app()
+# The handlers run outside of Flask's app context, so they use the app's objects directly.
+extensions = flask_app.extensions['paw']
+api_key_cache = extensions['api_key_cache']
+usage_counter = extensions['usage_counter']
+usage_series = extensions['usage_series']
+usage_broadcaster = extensions['usage_broadcaster']
+note_list_cache = extensions['note_list_cache']
+rate_limiter = extensions['rate_limiter']
+with flask_app.app_context():
+    database = AsyncDatabase(db.engine.url.database,
+                             size=flask_app.config['ASYNC_DB_POOL_SIZE'],
+                             pragmas=sqlite_tuning.PROFILES[flask_app.config['SQLITE_PROFILE']])
+
+
+def unauthorized():
+    return JSONResponse({'message': 'Unauthorized api key'}, status_code=401)
+
+
+def not_found():
+    return JSONResponse({'message': 'Note not found'}, status_code=404)
+
+
+async def verify_api_key(request):
+    api_key = request.query_params.get('api_key')
+    if api_key is None:
+        return None
+    user = api_key_cache.peek(api_key)
+    if user is MISSING:
+        async with database.connection() as connection:
+            async with connection.execute("SELECT user_id, email, rate_limit, rate_burst FROM user_info "
+                                          "WHERE api_key = ?", (api_key,)) as cursor:
+                row = await cursor.fetchone()
+        user = ApiUser(*row) if row else None
+        api_key_cache.put(api_key, user)
+    if user:
+        usage_counter.record(user.user_id, flush=False)
+        usage_series.record(user.user_id)
+        usage_broadcaster.increment(user.user_id)
+    return user
+
+
+def api_view(handler):
+    """Authenticate and rate limit like the ``notes`` namespace, then call ``handler(request, user)``."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        user = await verify_api_key(request)
+        if not user:
+            return unauthorized()
+        limit = None
+        if rate_limiter.enabled:
+            limit = rate_limiter.hit(request.query_params['api_key'], user.rate_limit, user.rate_burst)
+        if limit and not limit.allowed:
+            response = JSONResponse({'message': 'Rate limit exceeded'}, status_code=429)
+        else:
+            response = await handler(request, user)
+        if limit:
+            response.headers.update(rate_limiter.headers(limit))
+        return response
+    return wrapper
+
+
+async def read_note_payload(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if not (isinstance(payload.get('title'), str) and isinstance(payload.get('text'), str)):
+        return None
+    return payload
+
+
+async def note_list_version(connection, user_id):
+    async with connection.execute("SELECT change_seq FROM user_info WHERE user_id = ?", (user_id,)) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+@api_view
+async def list_notes(request, user):
+    async with database.connection() as connection:
+        version = await note_list_version(connection, user.user_id)
+    etag = note_list_cache.etag(user.user_id, version, request.scope['query_string'])
+    if f'"{etag}"' in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers={'ETag': f'"{etag}"'})
+    try:
+        limit = parse_limit(request.query_params.get('limit'), flask_app.config['NOTES_PAGE_SIZE'],
+                            flask_app.config['NOTES_MAX_PAGE_SIZE'])
+        fields = parse_fields(request.query_params.get('fields'), NOTE_FIELDS)
+        cursor = request.query_params.get('cursor')
+        cursor = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JSONResponse({'message': str(e)}, status_code=400)
+
+    columns = [field for field in NOTE_FIELDS if field in fields or field in ('id', 'date_added')]
+    query = f"SELECT {', '.join(columns)}, {DATE_TEXT} AS date_text FROM note WHERE user_id = ?"
+    parameters = [user.user_id]
+    if cursor is not None:
+        date_added, note_id = cursor
+        if date_added is None:
+            query += " AND (date_added IS NOT NULL OR id > ?)"
+            parameters.append(note_id)
+        else:
+            query += " AND (date_added > ? OR (date_added = ? AND id > ?))"
+            parameters += [date_added, date_added, note_id]
+    query += " ORDER BY date_added, id LIMIT ?"
+    parameters.append(limit + 1)
+    async with database.connection() as connection:
+        async with connection.execute(query, parameters) as result:
+            rows = await result.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date_added'], rows[-1]['id'])
+    output = []
+    for row in rows:
+        note_data = {field: row[field] for field in fields}
+        if 'date_added' in note_data:
+            note_data['date_added'] = row['date_text']
+        output.append(note_data)
+    return JSONResponse({'notes': output, 'next_cursor': next_cursor},
+                        headers={'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'})
+
+
+@api_view
+async def create_note(request, user):
+    payload = await read_note_payload(request)
+    if payload is None:
+        return JSONResponse({'message': 'Title and text are required'}, status_code=400)
+    async with database.connection() as connection:
+        await connection.execute("INSERT INTO note (user_id, title, text, date_added) VALUES (?, ?, ?, ?)",
+                                 (user.user_id, payload['title'], payload['text'],
+                                  datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')))
+        await connection.commit()
+    return JSONResponse({'title': payload['title'], 'text': payload['text']})
+
+
+@api_view
+async def get_note(request, user):
+    async with database.connection() as connection:
+        async with connection.execute(f"SELECT id, title, text, {DATE_TEXT} AS date_added FROM note "
+                                      "WHERE user_id = ? AND id = ?",
+                                      (user.user_id, request.path_params['id'])) as cursor:
+            row = await cursor.fetchone()
+    if row is None:
+        return not_found()
+    return JSONResponse({'id': row['id'], 'title': row['title'], 'text': row['text'],
+                         'date_added': row['date_added']})
+
+
+@api_view
+async def update_note(request, user):
+    payload = await read_note_payload(request)
+    if payload is None:
+        return JSONResponse({'message': 'Title and text are required'}, status_code=400)
+    async with database.connection() as connection:
+        cursor = await connection.execute("UPDATE note SET title = ?, text = ? WHERE user_id = ? AND id = ?",
+                                          (payload['title'], payload['text'], user.user_id,
+                                           request.path_params['id']))
+        await connection.commit()
+    if cursor.rowcount == 0:
+        return not_found()
+    return JSONResponse({'title': payload['title'], 'text': payload['text']})
+
+
+@api_view
+async def delete_note(request, user):
+    async with database.connection() as connection:
+        cursor = await connection.execute("DELETE FROM note WHERE user_id = ? AND id = ?",
+                                          (user.user_id, request.path_params['id']))
+        await connection.commit()
+    if cursor.rowcount == 0:
+        return not_found()
+    return JSONResponse({'message': 'Note deleted!'})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await database.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/notes', list_notes, methods=['GET']),
+        Route('/notes', create_note, methods=['POST']),
+        Route('/notes/{id:int}', get_note, methods=['GET']),
+        Route('/notes/{id:int}', update_note, methods=['PUT']),
+        Route('/notes/{id:int}', delete_note, methods=['DELETE']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+ApiUser = namedtuple('ApiUser', ['user_id', 'email', 'rate_limit', 'rate_burst'], defaults=(None, None))
+
+MISSING = object()
+
+
+class ApiKeyCache:
+    """Bounded LRU cache resolving API keys to :class:`ApiUser` records.
+
+    Unknown keys are cached as well (for ``negative_ttl`` seconds), so that
+    repeated requests with a bad key do not reach the database either.
+    :meth:`invalidate` only reaches this process: other workers keep
+    accepting a regenerated key until its entry expires, so ``ttl`` is the
+    longest an old key stays usable and is kept short.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30, negative_ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('API_KEY_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('API_KEY_CACHE_TTL', self.ttl)
+
+    def get(self, api_key, loader):
+        value = self.peek(api_key)
+        if value is MISSING:
+            value = loader(api_key)
+            self.put(api_key, value)
+        return value
+
+    def peek(self, api_key):
+        """Return the cached record (None for unknown keys) or ``MISSING`` on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(api_key, MISSING)
+            if entry is MISSING:
+                return MISSING
+            value, expires = entry
+            if expires <= now:
+                del self._entries[api_key]
+                return MISSING
+            self._entries.move_to_end(api_key)
+            return value
+
+    def put(self, api_key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[api_key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, api_key):
+        with self._lock:
+            self._entries.pop(api_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
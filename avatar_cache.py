@@ -0,0 +1,126 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from profile_pics import profile_pic_name
+
+
+class AvatarCache:
+    """Size-bounded, content-addressed disk cache of profile pictures.
+
+    Files are stored under the SHA-256 of their content, which doubles as
+    the ETag. Every user and variant points at the digest of the picture
+    version (storage etag) it was downloaded for. The least recently
+    served files are removed once the cache grows over ``max_bytes``, except
+    for files returned in the last ``grace`` seconds, which a response may
+    still be about to open. Variants are keyed by the full size picture's
+    etag too, which relies on the uploader writing the full size picture
+    last. A variant missing in storage is remembered until that etag
+    changes.
+    """
+
+    def __init__(self, pics, root=None, max_bytes=64 * 1024 * 1024, max_age=300, grace=10.0):
+        self.pics = pics
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.grace = grace
+        self.size = 0
+        self._files = OrderedDict()
+        self._used = {}
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.root = app.config.get('AVATAR_CACHE_DIR') or os.path.join(app.instance_path, 'avatars')
+        self.max_bytes = app.config.get('AVATAR_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_age = app.config.get('AVATAR_CACHE_MAX_AGE', self.max_age)
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.endswith('.jpg'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name[:-4], stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._files[digest] = size
+            self.size += size
+
+    def path(self, digest):
+        return os.path.join(self.root, f"{digest}.jpg")
+
+    def get(self, user_id, variant=None):
+        """Return ``(path, digest)`` of the user's picture, downloading it on a miss, or None."""
+        info = self.pics.get(user_id)
+        if not info.exists:
+            return None
+        key = (user_id, variant)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and entry[0] == info.etag:
+                digest = entry[1]
+                if digest is None:
+                    return None
+                if digest in self._files:
+                    self._use(digest)
+                    return self.path(digest), digest
+
+        try:
+            digest, size = self._download(profile_pic_name(user_id, variant))
+        except FileNotFoundError:
+            if variant is None:
+                raise
+            with self._lock:
+                self._index[key] = (info.etag, None)
+            return None
+        with self._lock:
+            if digest not in self._files:
+                self._files[digest] = size
+                self.size += size
+            self._use(digest)
+            self._index[key] = (info.etag, digest)
+            self._evict()
+        return self.path(digest), digest
+
+    def _use(self, digest):
+        self._files.move_to_end(digest)
+        self._used[digest] = time.monotonic()
+
+    def _download(self, name):
+        fd, temporary = tempfile.mkstemp(dir=self.root, suffix='.part')
+        os.close(fd)
+        try:
+            self.pics.backend.download(name, temporary)
+            sha256 = hashlib.sha256()
+            with open(temporary, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            size = os.path.getsize(temporary)
+            if size == 0:
+                raise FileNotFoundError(name)
+            os.replace(temporary, self.path(digest))
+            return digest, size
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _evict(self):
+        now = time.monotonic()
+        for digest in list(self._files):
+            if self.size <= self.max_bytes or len(self._files) <= 1:
+                break
+            if now - self._used.get(digest, float('-inf')) < self.grace:
+                continue
+            self.size -= self._files.pop(digest)
+            self._used.pop(digest, None)
+            self._index = {key: value for key, value in self._index.items() if value[1] != digest}
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
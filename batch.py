@@ -0,0 +1,65 @@
+from sqlalchemy import delete, insert, select, update
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+def is_note_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def apply_note_batch(session, model, user_id, operations):
+    """Apply a list of create/update/delete operations for one user.
+
+    Every kind of operation is executed as a single executemany statement.
+    The caller owns the transaction. Returns one result dict per operation,
+    in request order.
+    """
+    results = [None] * len(operations)
+    creates, updates, deletes = [], [], []
+
+    ids = {op.get('id') for op in operations
+           if isinstance(op, dict) and op.get('op') in ('update', 'delete') and is_note_id(op.get('id'))}
+    owned = set()
+    if ids:
+        owned = set(session.scalars(
+            select(model.id).where(model.user_id == user_id, model.id.in_(ids))
+        ))
+
+    for index, op in enumerate(operations):
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in OPERATIONS:
+            results[index] = {'op': kind, 'status': 400, 'message': 'Unknown operation'}
+            continue
+        if kind in ('create', 'update') and not (isinstance(op.get('title'), str) and isinstance(op.get('text'), str)):
+            results[index] = {'op': kind, 'id': op.get('id'), 'status': 400, 'message': 'Title and text are required'}
+            continue
+        if kind == 'create':
+            creates.append((index, {'user_id': user_id, 'title': op['title'], 'text': op['text']}))
+            continue
+        note_id = op.get('id')
+        if not is_note_id(note_id):
+            results[index] = {'op': kind, 'id': None, 'status': 400, 'message': 'Id must be an integer'}
+            continue
+        if note_id not in owned:
+            results[index] = {'op': kind, 'id': note_id, 'status': 404, 'message': 'Note not found'}
+            continue
+        if kind == 'update':
+            updates.append({'id': note_id, 'title': op['title'], 'text': op['text']})
+        else:
+            owned.discard(note_id)
+            deletes.append(note_id)
+        results[index] = {'op': kind, 'id': note_id, 'status': 200}
+
+    if creates:
+        new_ids = session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, row in creates]
+        ).all()
+        for (index, _), note_id in zip(creates, new_ids):
+            results[index] = {'op': 'create', 'id': note_id, 'status': 201}
+    if updates:
+        session.execute(update(model), updates)
+    if deletes:
+        session.execute(delete(model).where(model.user_id == user_id, model.id.in_(deletes)))
+
+    return results
@@ -0,0 +1,129 @@
+"""Latency of the notes API under concurrency: Flask (threaded) vs the ASGI twin.
+
+    python -m benchmarks.bench_async_notes [requests] [concurrency]
+
+Both servers are started as subprocesses on the same seeded SQLite database.
+Requests are fired from one ``httpx.AsyncClient`` with at most
+``concurrency`` in flight; reports throughput and p50/p99 latency.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, text
+
+from benchmarks.common import FIREBASE_PLACEHOLDERS, ROOT
+
+sys.path.insert(0, ROOT)
+
+from migrations import upgrade  # noqa: E402
+
+API_KEY = "bench-key"
+NOTES = 200
+
+FLASK_SERVER = (
+    "import sys; from werkzeug.serving import run_simple; from app import create_app; "
+    "run_simple('127.0.0.1', int(sys.argv[1]), create_app(), threaded=True)"
+)
+
+
+def create_database():
+    path = os.path.join(tempfile.mkdtemp(prefix="paw-bench-"), "paw.db")
+    engine = create_engine(f"sqlite:///{path}")
+    connection = engine.raw_connection()
+    upgrade(connection.driver_connection)
+    connection.close()
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user_info (user_id, email, api_key, total_requests) "
+                                "VALUES (1, 'bench@example.com', :key, 0)"), {'key': API_KEY})
+        connection.execute(text("INSERT INTO note (user_id, title, text, date_added) "
+                                "VALUES (1, :title, 'text', :date_added)"),
+                           [{'title': f"note {i}", 'date_added': f"2024-01-01 00:00:00.{i:06d}"} for i in range(NOTES)])
+    engine.dispose()
+    return path
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(command, env, port):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def run(base_url, total, concurrency):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get('/notes', params={'api_key': API_KEY, 'limit': 50})
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await one(client)
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    env = dict(os.environ, **FIREBASE_PLACEHOLDERS)
+    env.setdefault('SQLITE_PROFILE', 'production')
+    env['RATE_LIMIT_ENABLED'] = '0'
+    env['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{create_database()}"
+
+    servers = {
+        'flask (threaded)': [sys.executable, '-c', FLASK_SERVER],
+        'asgi (uvicorn)': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--log-level', 'warning', '--port'],
+    }
+    print(f"{total} requests, {concurrency} concurrent")
+    for name, command in servers.items():
+        port = free_port()
+        process = start(command + [str(port)], env, port)
+        try:
+            result = asyncio.run(run(f"http://127.0.0.1:{port}", total, concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{name:18} {result['rps']:8.0f} req/s   p50 {result['p50']:7.1f} ms   "
+              f"p99 {result['p99']:7.1f} ms   errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
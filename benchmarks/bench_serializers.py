@@ -0,0 +1,78 @@
+"""Encode time and bytes on the wire of a GET /notes payload of 10k notes.
+
+    python -m benchmarks.bench_serializers [notes] [iterations]
+
+Compares the stdlib json encoder Flask-RESTX used before with orjson and
+MessagePack, each uncompressed, gzip and brotli compressed, and formatting
+the dates in Python against formatting them in SQLite.
+"""
+import gzip
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import brotli
+import msgpack
+import orjson
+
+from benchmarks.common import ROOT
+
+sys.path.insert(0, ROOT)
+
+from serializers import DATE_FORMAT  # noqa: E402
+
+
+def timed(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - started) / iterations * 1000, result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE note (id INTEGER PRIMARY KEY, title TEXT, text TEXT, date_added DATETIME)")
+    start = datetime(2024, 1, 1)
+    connection.executemany("INSERT INTO note VALUES (?, ?, ?, ?)", (
+        (number, f"Notatka {number}", f"Treść notatki numer {number}, lorem ipsum dolor sit amet.",
+         (start + timedelta(seconds=number)).strftime('%Y-%m-%d %H:%M:%S.%f')) for number in range(1, size + 1)))
+
+    def python_dates():
+        return [{'id': id, 'title': title, 'text': text,
+                 'date_added': datetime.fromisoformat(date_added).strftime(DATE_FORMAT)}
+                for id, title, text, date_added in connection.execute("SELECT id, title, text, date_added FROM note")]
+
+    def sql_dates():
+        return [{'id': id, 'title': title, 'text': text, 'date_added': date_added}
+                for id, title, text, date_added in connection.execute(
+                    f"SELECT id, title, text, strftime('{DATE_FORMAT}', date_added) FROM note")]
+
+    python_ms, payload = timed(python_dates, iterations)
+    sql_ms, _ = timed(sql_dates, iterations)
+    payload = {'notes': payload, 'next_cursor': None}
+    print(f"{size} notes, mean of {iterations} runs")
+    print(f"  rows with dates formatted in Python  {python_ms:8.2f} ms")
+    print(f"  rows with dates formatted in SQLite  {sql_ms:8.2f} ms")
+    print()
+    print(f"  {'encoder':18} {'encode':>9} {'bytes':>10} {'gzip':>17} {'brotli':>17}")
+
+    encoders = [
+        ('json (before)', lambda: (json.dumps(payload) + "\n").encode()),
+        ('orjson', lambda: orjson.dumps(payload)),
+        ('msgpack', lambda: msgpack.packb(payload)),
+    ]
+    for name, encode in encoders:
+        encode_ms, body = timed(encode, iterations)
+        gzip_ms, gzipped = timed(lambda: gzip.compress(body, 6), max(1, iterations // 4))
+        brotli_ms, brotlied = timed(lambda: brotli.compress(body, quality=4), max(1, iterations // 4))
+        print(f"  {name:18} {encode_ms:6.2f} ms {len(body):10} "
+              f"{len(gzipped):8} {gzip_ms:5.1f} ms {len(brotlied):8} {brotli_ms:5.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
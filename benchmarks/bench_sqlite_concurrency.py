@@ -0,0 +1,108 @@
+"""Mixed reader/writer stress test of the SQLite engine profiles.
+
+    python -m benchmarks.bench_sqlite_concurrency [seconds] [readers] [writers]
+
+Readers page through the notes of a user, writers add notes and bump the
+request counters like the API does. Reports throughput and the number of
+"database is locked" errors per profile.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import ROOT
+
+sys.path.insert(0, ROOT)
+
+import sqlite_tuning  # noqa: E402
+from migrations import upgrade  # noqa: E402
+
+USERS = 20
+
+
+def create_database():
+    path = os.path.join(tempfile.mkdtemp(prefix="paw-bench-"), "paw.db")
+    engine = create_engine(f"sqlite:///{path}")
+    connection = engine.raw_connection()
+    upgrade(connection.driver_connection)
+    connection.close()
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user_info (user_id, email, api_key, total_requests) "
+                                "VALUES (:id, :email, :key, 0)"),
+                           [{'id': i, 'email': f"user{i}@example.com", 'key': f"key{i}"} for i in range(USERS)])
+        connection.execute(text("INSERT INTO note (user_id, title, text, date_added) "
+                                "VALUES (:user_id, 'title', 'text', datetime('now'))"),
+                           [{'user_id': i % USERS} for i in range(USERS * 50)])
+    engine.dispose()
+    return path
+
+
+def reader(engine, stop, counts, number):
+    while not stop.is_set():
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT id, title, text, date_added FROM note WHERE user_id = :user_id "
+                                        "ORDER BY date_added, id LIMIT 100"), {'user_id': number % USERS}).all()
+            counts['reads'] += 1
+        except OperationalError as e:
+            counts['locked' if 'locked' in str(e) else 'errors'] += 1
+        number += 1
+
+
+def writer(engine, stop, counts, number):
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("INSERT INTO note (user_id, title, text, date_added) "
+                                        "VALUES (:user_id, 'title', 'text', datetime('now'))"),
+                                   {'user_id': number % USERS})
+                connection.execute(text("UPDATE user_info SET total_requests = total_requests + 1 "
+                                        "WHERE user_id = :user_id"), {'user_id': number % USERS})
+            counts['writes'] += 1
+        except OperationalError as e:
+            counts['locked' if 'locked' in str(e) else 'errors'] += 1
+        number += 1
+
+
+def run(profile, seconds, readers, writers):
+    path = create_database()
+    options = sqlite_tuning.engine_options(profile)
+    if profile == 'default':
+        # The sqlite3 module waits 5 seconds for a lock by default; like a
+        # stock deployment, give up immediately so contention is visible.
+        options['connect_args']['timeout'] = 0
+    engine = create_engine(f"sqlite:///{path}", **options)
+    sqlite_tuning.install(engine, profile)
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    threads = [threading.Thread(target=reader, args=(engine, stop, counts, i)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(engine, stop, counts, i)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(f"{profile:<11} reads {counts['reads'] / seconds:9.1f}/s  writes {counts['writes'] / seconds:8.1f}/s  "
+          f"locked {counts['locked']:6d}  other errors {counts['errors']}")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    print(f"{readers} readers, {writers} writers, {seconds:g}s per profile")
+    for profile in sqlite_tuning.PROFILES:
+        run(profile, seconds, readers, writers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Worker startup cost: importing ``app``, ``create_app()`` and the first request.
+
+    python -m benchmarks.bench_startup [runs]
+
+Every run is a fresh interpreter, like a newly forked worker, using a
+migrated temporary SQLite database. Reports the median and the worst run.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ROOT
+
+sys.path.insert(0, ROOT)
+
+from migrate import migrate  # noqa: E402
+
+WORKER = """
+import json, sys, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+app = module.create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'SECRET_KEY': 'benchmark', 'TESTING': True})
+created = time.perf_counter()
+response = app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first request': answered - created, 'total': answered - started,
+                  'pyrebase imported': 'pyrebase' in sys.modules}))
+"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    database = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='paw-bench-'), 'paw.db')}"
+    migrate(database)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', WORKER, database], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    print(f"{runs} worker starts")
+    for phase in ('import', 'create_app', 'first request', 'total'):
+        timings = [result[phase] * 1000 for result in results]
+        print(f"  {phase:14} median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms")
+    print(f"  pyrebase imported before the first Firebase call: {any(r['pyrebase imported'] for r in results)}")
+
+
+if __name__ == '__main__':
+    main()
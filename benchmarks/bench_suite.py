@@ -0,0 +1,227 @@
+"""Offline benchmark suite of the notes API, the index page and the websocket broadcast.
+
+    python -m benchmarks.bench_suite [--sizes 1000 100000 1000000] [--iterations 500]
+                                     [--baseline benchmarks/baseline.json] [--save-baseline]
+                                     [--tolerance 0.25] [--p99-tolerance 1.0]
+
+Every data set size is seeded into a fresh database and measured in its own process,
+with Firebase Auth and Storage replaced by local fakes (see
+``benchmarks.common.load_app``). Notes are spread over users owning
+NOTES_PER_USER notes each, so larger data sets grow the tables and indexes
+rather than the page a single user renders.
+
+For every scenario the suite reports throughput and p50/p95/p99 latency,
+plus the peak RSS of the process. Results are compared with the baseline
+file: a throughput drop or peak RSS growth beyond ``--tolerance``, or a p99
+increase beyond ``--p99-tolerance``, is reported as a regression and makes
+the command exit with status 1.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import ROOT, load_app
+
+sys.path.insert(0, ROOT)
+
+from migrations import upgrade  # noqa: E402
+
+NOTES_PER_USER = 1000
+SOCKETS = 50
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def seed_database(size):
+    """Create a database holding ``size`` notes. The full-text index is built once at the end."""
+    path = os.path.join(tempfile.mkdtemp(prefix="paw-bench-"), "paw.db")
+    connection = sqlite3.connect(path)
+    upgrade(connection, target=1)
+    connection.execute("PRAGMA synchronous = OFF")
+    users = max(SOCKETS, -(-size // NOTES_PER_USER))
+    connection.executemany("INSERT INTO user_info (user_id, email, api_key, total_requests) VALUES (?, ?, ?, 0)",
+                           ((user_id, f"user{user_id}@example.com", f"key{user_id}")
+                            for user_id in range(1, users + 1)))
+    connection.executemany("INSERT INTO note (user_id, title, text, date_added) VALUES (?, ?, ?, ?)",
+                           ((number // NOTES_PER_USER + 1, f"Notatka {number}",
+                             f"Treść notatki numer {number}, lorem ipsum dolor sit amet.",
+                             f"2024-01-01 {number // 3600000 % 24:02d}:{number // 60000 % 60:02d}:"
+                             f"{number // 1000 % 60:02d}.{number % 1000:03d}000")
+                            for number in range(size)))
+    connection.commit()
+    upgrade(connection)
+    connection.close()
+    return path
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def measure(func, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for number in range(iterations):
+        call_started = time.perf_counter()
+        func(number)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': iterations / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def expect(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.method} {response.request.path}: "
+                           f"{response.status_code} instead of {status}")
+    return response
+
+
+def run_scenarios(database, iterations):
+    module, app = load_app(database=database, RATE_LIMIT_ENABLED=False, METRICS_ENABLED=False)
+    for user_id in range(1, SOCKETS + 1):
+        app.config['FIREBASE_AUTH'].add_account(f"user{user_id}@example.com", "benchmark")
+    api_key = "key1"
+    client = app.test_client()
+    with app.app_context():
+        note_ids = [note.id for note in module.Note.query.filter_by(user_id=1).limit(iterations)]
+
+    created = []
+
+    def create_note(number):
+        expect(client.post('/notes', query_string={'api_key': api_key},
+                           json={'title': f"Nowa {number}", 'text': "Treść"}))
+
+    def delete_note(number):
+        if not created:
+            with app.app_context():
+                created.extend(note.id for note in module.Note.query.filter(module.Note.title.like("Nowa %")))
+        expect(client.delete(f'/notes/{created[number]}', query_string={'api_key': api_key}))
+
+    def touch_notes(user_id):
+        # Advances the note list version like any note write would.
+        with app.app_context():
+            module.db.session.execute(text("UPDATE user_info SET change_seq = change_seq + 1 WHERE user_id = :id"),
+                                      {'id': user_id})
+            module.db.session.commit()
+
+    expect(client.post('/', data={'email': "user1@example.com", 'password': "benchmark"}))
+
+    scenarios = [
+        ('GET /notes', lambda number: expect(client.get('/notes', query_string={'api_key': api_key}))),
+        ('GET /notes/<id>', lambda number: expect(
+            client.get(f'/notes/{note_ids[number % len(note_ids)]}', query_string={'api_key': api_key}))),
+        ('PUT /notes/<id>', lambda number: expect(
+            client.put(f'/notes/{note_ids[number % len(note_ids)]}', query_string={'api_key': api_key},
+                       json={'title': f"Zmieniona {number}", 'text': "Treść"}))),
+        ('POST /notes', create_note),
+        ('DELETE /notes/<id>', delete_note),
+        ('GET / (cached)', lambda number: expect(client.get('/'))),
+        ('GET / (after a write)', lambda number: (touch_notes(1), expect(client.get('/')))),
+    ]
+
+    results = {name: measure(func, iterations) for name, func in scenarios}
+
+    sockets = []
+    for user_id in range(1, SOCKETS + 1):
+        user_client = app.test_client()
+        expect(user_client.post('/', data={'email': f"user{user_id}@example.com", 'password': "benchmark"}))
+        sockets.append(app.extensions['paw']['socketio'].test_client(app, flask_test_client=user_client))
+
+    usage_broadcaster = app.extensions['paw']['usage_broadcaster']
+
+    def broadcast(number):
+        for user_id in range(1, SOCKETS + 1):
+            usage_broadcaster.increment(user_id)
+        usage_broadcaster.broadcast()
+
+    results[f'websocket broadcast ({SOCKETS} rooms)'] = measure(broadcast, iterations)
+    for socket in sockets:
+        socket.disconnect()
+
+    return {'scenarios': results, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def compare(results, baseline, tolerance, p99_tolerance):
+    regressions = []
+    for size, result in results.items():
+        previous_rss = baseline.get(size, {}).get('peak_rss_mb')
+        if previous_rss and result['peak_rss_mb'] > previous_rss * (1 + tolerance):
+            regressions.append(f"{size} notes: peak RSS {result['peak_rss_mb']:.0f} MB "
+                               f"(baseline {previous_rss:.0f})")
+        for name, current in result['scenarios'].items():
+            previous = baseline.get(size, {}).get('scenarios', {}).get(name)
+            if previous is None:
+                continue
+            if current['rps'] < previous['rps'] * (1 - tolerance):
+                regressions.append(f"{size} notes, {name}: {current['rps']:.0f} req/s "
+                                   f"(baseline {previous['rps']:.0f})")
+            if current['p99_ms'] > previous['p99_ms'] * (1 + p99_tolerance):
+                regressions.append(f"{size} notes, {name}: p99 {current['p99_ms']:.2f} ms "
+                                   f"(baseline {previous['p99_ms']:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--p99-tolerance', type=float, default=1.0)
+    parser.add_argument('--worker', metavar='DATABASE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_scenarios(args.worker, args.iterations)))
+        return
+
+    results = {}
+    for size in args.sizes:
+        database = seed_database(size)
+        try:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_suite', '--worker', database,
+                                     '--iterations', str(args.iterations)],
+                                    cwd=ROOT, check=True, stdout=subprocess.PIPE, text=True).stdout
+        finally:
+            shutil.rmtree(os.path.dirname(database))
+        result = results[str(size)] = json.loads(output.splitlines()[-1])
+        print(f"\n{size} notes, peak RSS {result['peak_rss_mb']:.0f} MB")
+        for name, scenario in result['scenarios'].items():
+            print(f"  {name:34} {scenario['rps']:8.0f} req/s   p50 {scenario['p50_ms']:7.2f} ms   "
+                  f"p95 {scenario['p95_ms']:7.2f} ms   p99 {scenario['p99_ms']:7.2f} ms")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance, args.p99_tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
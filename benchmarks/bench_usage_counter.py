@@ -0,0 +1,40 @@
+"""Compare API throughput with per-request stats commits and write-behind batching.
+
+    python -m benchmarks.bench_usage_counter [iterations]
+"""
+import sys
+
+from benchmarks.common import load_app, create_user, measure
+
+
+def run(app, api_key, threshold, iterations):
+    counter = app.extensions['paw']['usage_counter']
+    counter.flush_threshold = threshold
+    client = app.test_client()
+
+    def call():
+        client.get(f"/notes?api_key={api_key}")
+
+    rate = measure(call, iterations)
+    counter.flush()
+    return rate
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    module, app = load_app(USAGE_FLUSH_INTERVAL=0, RATE_LIMIT_ENABLED=False)
+    user_id, api_key = create_user(module, app)
+
+    per_request = run(app, api_key, 1, iterations)
+    batched = run(app, api_key, app.config["USAGE_FLUSH_THRESHOLD"], iterations)
+
+    with app.app_context():
+        total = module.db.session.get(module.User, user_id).total_requests
+
+    print(f"commit per request : {per_request:10.1f} req/s")
+    print(f"write-behind       : {batched:10.1f} req/s ({batched / per_request:.2f}x)")
+    print(f"recorded requests  : {total} (expected {2 * iterations})")
+
+
+if __name__ == "__main__":
+    main()
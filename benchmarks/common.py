@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIREBASE_PLACEHOLDERS = {
+    "API_KEY": "benchmark",
+    "AUTH_DOMAIN": "benchmark.firebaseapp.com",
+    "DATABASE_URL": "https://benchmark.firebaseio.com",
+    "PROJECT_ID": "benchmark",
+    "STORAGE_BUCKET": "benchmark.appspot.com",
+    "MESSAGING_SENDER_ID": "0",
+    "APP_ID": "benchmark",
+    "SECRET_KEY": "benchmark",
+}
+
+
+def load_app(database=None, **config):
+    """Build the application against a throwaway SQLite database.
+
+    Auth is replaced with a :class:`firebase_client.LocalAuth` (available as
+    ``app.config['FIREBASE_AUTH']``, add accounts with ``add_account``) and
+    profile pictures are kept in a temporary directory, so nothing in the
+    benchmarks talks to Firebase.
+    ``database`` is the path of an existing database to use instead of a new
+    one; ``config`` overrides settings of the app. Returns the ``app`` module
+    and the Flask application.
+    """
+    directory = tempfile.mkdtemp(prefix="paw-bench-")
+    db_path = database or os.path.join(directory, "paw.db")
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    import app as module
+    from firebase_client import LocalAuth
+    from migrations import upgrade
+    connection = sqlite3.connect(db_path)
+    upgrade(connection)
+    connection.close()
+    local_auth = LocalAuth(FIREBASE_PLACEHOLDERS["PROJECT_ID"])
+    app = module.create_app({
+        "FIREBASE_CONFIG": {**module.load_config()["FIREBASE_CONFIG"], "projectId": local_auth.project_id},
+        "FIREBASE_AUTH": local_auth,
+        "FIREBASE_SIGNING_KEYS": local_auth.signing_keys,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "PROFILE_PIC_LOCAL_ROOT": os.path.join(directory, "profile_pics"),
+        "SECRET_KEY": "benchmark",
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        **config,
+    })
+    return module, app
+
+
+def create_user(module, app, email="bench@example.com"):
+    with app.app_context():
+        user = module.User(email=email, api_key=module.generate_api_key(), total_requests=0)
+        module.db.session.add(user)
+        module.db.session.commit()
+        return user.user_id, user.api_key
+
+
+def measure(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed
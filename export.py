@@ -0,0 +1,22 @@
+import zlib
+
+import orjson
+
+
+def ndjson_chunks(partitions, fields):
+    """Encode each partition of rows as one block of newline-delimited JSON.
+
+    Dates are expected to be formatted by the query already (``serializers.sql_date``).
+    """
+    for rows in partitions:
+        if rows:
+            yield b''.join(orjson.dumps({field: getattr(row, field) for field in fields}) + b'\n' for row in rows)
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
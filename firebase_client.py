@@ -0,0 +1,138 @@
+import secrets
+import threading
+import time
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from requests import HTTPError
+
+from id_tokens import decode_claims, sign_id_token
+
+
+class Firebase:
+    """pyrebase app that is only built when a route first talks to Firebase.
+
+    Importing pyrebase pulls in the Google Cloud and oauth2client packages,
+    so the import, ``initialize_app`` and ``auth()`` are all deferred until
+    the first use instead of slowing down every worker boot and test run.
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.config = {}
+        self._app = None
+        self._auth = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.config = app.config['FIREBASE_CONFIG']
+        self._app = None
+        # FIREBASE_AUTH replaces pyrebase's Auth, e.g. with a LocalAuth in tests.
+        self._auth = app.config.get('FIREBASE_AUTH')
+
+    @property
+    def app(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    import pyrebase
+                    firebase = pyrebase.initialize_app(self.config)
+                    firebase.requests = self.http
+                    # Auth and Storage.download call the module level requests functions
+                    # instead of the session they were given, so route those through the pool too.
+                    pyrebase.pyrebase.requests = self.http
+                    self._app = firebase
+        return self._app
+
+    def auth(self):
+        if self._auth is None:
+            self._auth = self.app.auth()
+        return self._auth
+
+    def storage(self):
+        return self.app.storage()
+
+
+class LazyAuth:
+    """Stands in for ``firebase.auth()``; the client is created on the first call."""
+
+    def __init__(self, firebase):
+        self._firebase = firebase
+
+    def __getattr__(self, name):
+        return getattr(self._firebase.auth(), name)
+
+
+class LocalAuth:
+    """In-memory stand-in for pyrebase's Auth that signs ID tokens with its own RSA key.
+
+    Pass it as FIREBASE_AUTH and ``signing_keys`` as FIREBASE_SIGNING_KEYS to
+    run the login flow without Firebase. Errors carry the same codes as the
+    Firebase REST API (EMAIL_NOT_FOUND, INVALID_PASSWORD, EMAIL_EXISTS).
+    """
+
+    def __init__(self, project_id, lifetime=3600):
+        self.project_id = project_id
+        self.lifetime = lifetime
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = secrets.token_hex(8)
+        self.accounts = {}
+        self.sent_emails = []
+
+    @property
+    def signing_keys(self):
+        return {self.kid: self.private_key.public_key()}
+
+    def add_account(self, email, password, verified=True):
+        self.accounts[email] = {'localId': secrets.token_hex(14), 'password': password, 'emailVerified': verified}
+        return self.accounts[email]
+
+    def id_token(self, email, issued_at=None):
+        account = self.accounts[email]
+        issued_at = int(time.time() if issued_at is None else issued_at)
+        return sign_id_token({
+            'iss': f"https://securetoken.google.com/{self.project_id}",
+            'aud': self.project_id,
+            'auth_time': issued_at,
+            'user_id': account['localId'],
+            'sub': account['localId'],
+            'iat': issued_at,
+            'exp': issued_at + self.lifetime,
+            'email': email,
+            'email_verified': account['emailVerified'],
+            'firebase': {'identities': {'email': [email]}, 'sign_in_provider': 'password'},
+        }, self.private_key, self.kid)
+
+    def _response(self, email):
+        return {'localId': self.accounts[email]['localId'], 'email': email, 'idToken': self.id_token(email),
+                'refreshToken': secrets.token_hex(32), 'expiresIn': str(self.lifetime)}
+
+    def sign_in_with_email_and_password(self, email, password):
+        account = self.accounts.get(email)
+        if account is None:
+            raise HTTPError('EMAIL_NOT_FOUND')
+        if account['password'] != password:
+            raise HTTPError('INVALID_PASSWORD')
+        return self._response(email)
+
+    def create_user_with_email_and_password(self, email, password):
+        if email in self.accounts:
+            raise HTTPError('EMAIL_EXISTS')
+        self.add_account(email, password, verified=False)
+        return self._response(email)
+
+    def get_account_info(self, id_token):
+        email = decode_claims(id_token)['email']
+        account = self.accounts[email]
+        return {'users': [{'localId': account['localId'], 'email': email,
+                           'emailVerified': account['emailVerified']}]}
+
+    def send_email_verification(self, id_token):
+        email = decode_claims(id_token)['email']
+        self.sent_emails.append(('VERIFY_EMAIL', email))
+        return {'email': email}
+
+    def send_password_reset_email(self, email):
+        if email not in self.accounts:
+            raise HTTPError('EMAIL_NOT_FOUND')
+        self.sent_emails.append(('PASSWORD_RESET', email))
+        return {'email': email}
@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_ID_SEGMENT = re.compile(r'\d+')
+
+
+class EndpointStats:
+    __slots__ = ('count', 'errors', 'total_seconds', 'max_seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {'count': self.count, 'errors': self.errors,
+                'total_seconds': self.total_seconds, 'max_seconds': self.max_seconds}
+
+
+class HttpClient:
+    """One pooled keep-alive session for every outbound HTTP call.
+
+    Requests get default connect/read timeouts and are retried with
+    exponential backoff on connection errors and on 429/5xx responses to
+    idempotent methods. Latency is recorded per endpoint, and the number of
+    requests in flight is compared with the pool size to show saturation.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff=0.3):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.saturated = 0
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self.session = self._create_session()
+
+    def init_app(self, app):
+        self.pool_size = app.config.get('HTTP_POOL_SIZE', self.pool_size)
+        self.timeout = (app.config.get('HTTP_CONNECT_TIMEOUT', self.timeout[0]),
+                        app.config.get('HTTP_READ_TIMEOUT', self.timeout[1]))
+        self.retries = app.config.get('HTTP_RETRIES', self.retries)
+        self.backoff = app.config.get('HTTP_BACKOFF', self.backoff)
+        self.session.close()
+        self.session = self._create_session()
+
+    def _create_session(self):
+        retry = Retry(total=self.retries, backoff_factor=self.backoff,
+                      status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        for scheme in ('http://', 'https://'):
+            session.mount(scheme, adapter)
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = self.endpoint(method, url)
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.in_flight > self.pool_size:
+                self.saturated += 1
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record(endpoint, time.perf_counter() - started, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    @staticmethod
+    def endpoint(method, url):
+        parts = urlsplit(url)
+        return f"{method} {parts.netloc}{_ID_SEGMENT.sub(':id', parts.path)}"
+
+    def _record(self, endpoint, seconds, failed):
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.count += 1
+            stats.errors += failed
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'saturated': self.saturated,
+                'endpoints': {name: stats.as_dict() for name, stats in self._endpoints.items()},
+            }
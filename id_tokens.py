@@ -0,0 +1,199 @@
+import base64
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidIdToken(ValueError):
+    pass
+
+
+class SigningKeysUnavailable(Exception):
+    """No signing keys could be fetched, so tokens cannot be verified locally."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def public_key(key):
+    """Accept an X.509 certificate or public key in PEM, or an already loaded public key."""
+    if isinstance(key, str):
+        key = key.encode()
+    if not isinstance(key, bytes):
+        return key
+    if b'CERTIFICATE' in key:
+        return x509.load_pem_x509_certificate(key).public_key()
+    return serialization.load_pem_public_key(key)
+
+
+def sign_id_token(claims, private_key, kid):
+    header = {'alg': 'RS256', 'kid': kid, 'typ': 'JWT'}
+    signing_input = f"{_b64encode(json.dumps(header).encode())}.{_b64encode(json.dumps(claims).encode())}"
+    signature = private_key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+    return f"{signing_input}.{_b64encode(signature)}"
+
+
+def decode_claims(token):
+    """Claims of a token without checking anything. Only for tokens from a trusted source."""
+    return json.loads(_b64decode(token.split('.')[1]))
+
+
+class SigningKeyCache:
+    """Public keys Firebase ID tokens are signed with, by key id.
+
+    The certificates are kept for the Cache-Control max-age of the response.
+    Google publishes a new key before signing with it, but a token with an
+    unknown key id still triggers an early refresh, at most once every
+    ``min_refresh`` seconds. If a refresh fails the old keys stay in use,
+    even past their expiry; ``get`` raises SigningKeysUnavailable only when
+    no key set was ever fetched. A static key set (``set_keys``) is never
+    refreshed.
+    """
+
+    def __init__(self, http=None, url=CERTS_URL, min_refresh=60, default_max_age=3600):
+        self.http = http
+        self.url = url
+        self.min_refresh = min_refresh
+        self.default_max_age = default_max_age
+        self._keys = {}
+        self._static = False
+        self._fetched = float('-inf')
+        self._expires = float('-inf')
+        self._lock = threading.Lock()
+
+    def set_keys(self, keys):
+        with self._lock:
+            self._keys = {kid: public_key(key) for kid, key in keys.items()}
+            self._static = True
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._static = False
+            self._fetched = float('-inf')
+            self._expires = float('-inf')
+
+    def get(self, kid):
+        with self._lock:
+            if not self._static:
+                now = time.monotonic()
+                unknown = kid not in self._keys and now - self._fetched >= self.min_refresh
+                if now >= self._expires or unknown:
+                    self._refresh(now)
+                if not self._keys:
+                    raise SigningKeysUnavailable(f"Could not fetch the signing keys from {self.url}")
+            return self._keys.get(kid)
+
+    def _refresh(self, now):
+        self._fetched = now
+        try:
+            response = self.http.get(self.url)
+            response.raise_for_status()
+            self._keys = {kid: public_key(pem) for kid, pem in response.json().items()}
+        except Exception:
+            logger.warning("Could not refresh the signing keys, keeping %d old ones", len(self._keys), exc_info=True)
+            self._expires = now + self.min_refresh
+            return
+        max_age = _MAX_AGE.search(response.headers.get('Cache-Control', ''))
+        self._expires = now + (int(max_age.group(1)) if max_age else self.default_max_age)
+
+
+class IdTokenVerifier:
+    """Verifies Firebase ID tokens locally: RS256 signature, audience, issuer and lifetime.
+
+    ``verify`` raises SigningKeysUnavailable, not InvalidIdToken, when there
+    are no keys to check the signature with.
+    """
+
+    def __init__(self, keys, project_id=None, leeway=60):
+        self.keys = keys
+        self.project_id = project_id
+        self.leeway = leeway
+
+    def init_app(self, app):
+        self.project_id = app.config['FIREBASE_CONFIG'].get('projectId')
+        if app.config.get('FIREBASE_SIGNING_KEYS'):
+            self.keys.set_keys(app.config['FIREBASE_SIGNING_KEYS'])
+        else:
+            self.keys.clear()
+
+    def verify(self, token):
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature_segment)
+        except (AttributeError, ValueError) as e:
+            raise InvalidIdToken('Malformed token') from e
+        if header.get('alg') != 'RS256':
+            raise InvalidIdToken('Unexpected signing algorithm')
+        key = self.keys.get(header.get('kid'))
+        if key is None:
+            raise InvalidIdToken('Unknown signing key')
+        try:
+            key.verify(signature, f"{header_segment}.{payload_segment}".encode(), padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature as e:
+            raise InvalidIdToken('Invalid signature') from e
+
+        now = time.time()
+        if claims.get('aud') != self.project_id:
+            raise InvalidIdToken('Wrong audience')
+        if claims.get('iss') != f"https://securetoken.google.com/{self.project_id}":
+            raise InvalidIdToken('Wrong issuer')
+        if not claims.get('sub'):
+            raise InvalidIdToken('Missing subject')
+        if claims.get('exp', 0) <= now - self.leeway:
+            raise InvalidIdToken('Token expired')
+        if claims.get('iat', 0) > now + self.leeway:
+            raise InvalidIdToken('Token issued in the future')
+        return claims
+
+
+class VerifiedAccountCache:
+    """Firebase accounts known to have a verified email address.
+
+    An address stays verified, so entries never expire; only the least
+    recently used ones are dropped beyond ``maxsize``.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('VERIFIED_ACCOUNT_CACHE_SIZE', self.maxsize)
+
+    def email_verified(self, uid, claims, loader):
+        """Use the cache, then the ``email_verified`` claim, and only call ``loader`` if the token has none."""
+        with self._lock:
+            if uid in self._accounts:
+                self._accounts.move_to_end(uid)
+                return True
+        verified = claims.get('email_verified')
+        if verified is None:
+            verified = loader()
+        if verified:
+            with self._lock:
+                self._accounts[uid] = True
+                if len(self._accounts) > self.maxsize:
+                    self._accounts.popitem(last=False)
+        return bool(verified)
@@ -0,0 +1,214 @@
+import atexit
+import json
+import threading
+import time
+
+from sqlalchemy import text
+
+JOB_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS job
+       (id INTEGER PRIMARY KEY,
+        task VARCHAR(255) NOT NULL,
+        payload TEXT,
+        idempotency_key VARCHAR(255) UNIQUE,
+        status VARCHAR(16) NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at FLOAT NOT NULL,
+        locked_until FLOAT,
+        last_error TEXT,
+        created_at FLOAT NOT NULL,
+        updated_at FLOAT NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS ix_job_status_run_at ON job (status, run_at)",
+]
+
+
+class PermanentJobError(Exception):
+    """Raised by a task when retrying cannot help; the job fails right away."""
+
+
+class JobQueue:
+    """Background jobs kept in the ``job`` table of the app database.
+
+    ``enqueue`` only inserts a row and wakes a worker thread. Workers claim
+    due jobs with a lease, run the registered task and retry failures with
+    exponential backoff (``backoff`` * 2^n seconds) up to ``max_attempts``.
+    A job whose worker died is claimed again once its lease runs out, and a
+    job enqueued again with the same idempotency key is not added twice.
+    Workers start in ``init_app`` when an earlier process left unfinished
+    jobs, otherwise with the first enqueued job, so register the tasks
+    before calling it. On shutdown the workers finish the jobs that are due
+    before exiting.
+    """
+
+    def __init__(self, db, workers=2, max_attempts=5, backoff=2.0, lease=60.0, poll_interval=1.0,
+                 drain_timeout=10.0, retention=7 * 24 * 3600):
+        self.db = db
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.drain_timeout = drain_timeout
+        self.retention = retention
+        self.app = None
+        self.tasks = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._draining = threading.Event()
+        self._pruned = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('JOBS_WORKERS', self.workers)
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', self.max_attempts)
+        self.backoff = app.config.get('JOBS_RETRY_BACKOFF', self.backoff)
+        self.drain_timeout = app.config.get('JOBS_DRAIN_TIMEOUT', self.drain_timeout)
+        atexit.register(self.drain)
+        if self._has_unfinished():
+            self._ensure_workers()
+
+    def task(self, name):
+        """Register the decorated function as the task ``name``; the payload is passed as keyword arguments."""
+        def decorator(func):
+            self.tasks[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, task, payload=None, key=None):
+        """Queue a job and return its id. With a ``key`` already queued, the existing job's id is returned."""
+        now = time.time()
+        with self.app.app_context(), self.db.engine.begin() as connection:
+            job_id = connection.execute(text("""
+                INSERT INTO job (task, payload, idempotency_key, status, max_attempts, run_at, created_at, updated_at)
+                VALUES (:task, :payload, :key, 'queued', :max_attempts, :now, :now, :now)
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING id
+            """), {'task': task, 'payload': json.dumps(payload or {}), 'key': key,
+                   'max_attempts': self.max_attempts, 'now': now}).scalar()
+            if job_id is None:
+                job_id = connection.execute(text("SELECT id FROM job WHERE idempotency_key = :key"),
+                                            {'key': key}).scalar()
+        self._ensure_workers()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def status(self, job_id=None, key=None):
+        """Return the state of a job by id or idempotency key, or None if there is no such job."""
+        column = 'id' if key is None else 'idempotency_key'
+        with self.app.app_context(), self.db.engine.connect() as connection:
+            row = connection.execute(text(f"""
+                SELECT id, task, idempotency_key, status, attempts, max_attempts, run_at, last_error,
+                       created_at, updated_at
+                FROM job WHERE {column} = :value
+            """), {'value': job_id if key is None else key}).mappings().first()
+        return dict(row) if row else None
+
+    def drain(self, timeout=None):
+        """Let the workers finish every due job, then stop them. Jobs scheduled for later stay queued."""
+        self._draining.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            self._draining.clear()
+
+    def run_pending(self):
+        """Run due jobs in the calling thread until none is left. Returns the number of jobs run."""
+        count = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return count
+            self._execute(job)
+            count += 1
+
+    def _has_unfinished(self):
+        # Running jobs may belong to a crashed worker; they are claimed again once their lease runs out.
+        try:
+            with self.app.app_context(), self.db.engine.connect() as connection:
+                return connection.execute(text(
+                    "SELECT EXISTS (SELECT 1 FROM job WHERE status IN ('queued', 'running'))")).scalar()
+        except Exception as e:
+            print(e)
+            return False
+
+    def _ensure_workers(self):
+        if self._threads or self.workers <= 0:
+            return
+        with self._lock:
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._run, name=f'jobs-{number}', daemon=True)
+                                 for number in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+                if job is not None:
+                    self._execute(job)
+                    continue
+            except Exception as e:
+                print(e)
+            if self._draining.is_set():
+                return
+            self._prune()
+            with self._wakeup:
+                self._wakeup.wait(self.poll_interval)
+
+    def _claim(self):
+        now = time.time()
+        with self.app.app_context(), self.db.engine.begin() as connection:
+            return connection.execute(text("""
+                UPDATE job SET status = 'running', attempts = attempts + 1, locked_until = :lease, updated_at = :now
+                WHERE id = (SELECT id FROM job
+                            WHERE (status = 'queued' AND run_at <= :now)
+                               OR (status = 'running' AND locked_until <= :now)
+                            ORDER BY run_at, id LIMIT 1)
+                RETURNING id, task, payload, attempts, max_attempts
+            """), {'now': now, 'lease': now + self.lease}).first()
+
+    def _execute(self, job):
+        try:
+            task = self.tasks.get(job.task)
+            if task is None:
+                raise PermanentJobError(f"Unknown task {job.task}")
+            with self.app.app_context():
+                task(**json.loads(job.payload))
+        except Exception as e:
+            print(e)
+            if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+                self._finish(job.id, 'failed', repr(e))
+            else:
+                self._finish(job.id, 'queued', repr(e), run_at=time.time() + self.backoff * 2 ** (job.attempts - 1))
+        else:
+            self._finish(job.id, 'done')
+
+    def _finish(self, job_id, status, error=None, run_at=None):
+        # Finished jobs drop their payload, it may hold tokens.
+        with self.app.app_context(), self.db.engine.begin() as connection:
+            connection.execute(text("""
+                UPDATE job SET status = :status, last_error = :error, locked_until = NULL,
+                               run_at = COALESCE(:run_at, run_at), updated_at = :now,
+                               payload = CASE WHEN :status = 'queued' THEN payload END
+                WHERE id = :id
+            """), {'status': status, 'error': error, 'run_at': run_at, 'now': time.time(), 'id': job_id})
+
+    def _prune(self):
+        now = time.time()
+        if now - self._pruned < 3600:
+            return
+        self._pruned = now
+        try:
+            with self.app.app_context(), self.db.engine.begin() as connection:
+                connection.execute(text("DELETE FROM job WHERE status IN ('done', 'failed') AND updated_at < :before"),
+                                   {'before': now - self.retention})
+        except Exception as e:
+            print(e)
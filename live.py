@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class UsageBroadcaster:
+    """Pushes per-user API request rates to websocket rooms.
+
+    Every logged in socket joins the room of its user. Requests are counted
+    in one-second buckets, but only for users that have a socket connected,
+    and each room receives the request rate over the last ``window`` seconds
+    at most ``max_rate`` times per second. Rooms without traffic get nothing.
+    """
+
+    def __init__(self, socketio, event='updateData', max_rate=1.0, window=10):
+        self.socketio = socketio
+        self.event = event
+        self.max_rate = max_rate
+        self.window = window
+        self._sockets = {}
+        self._rooms = {}
+        self._buckets = {}
+        self._task = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_rate = app.config.get('WEBSOCKET_MAX_RATE', self.max_rate)
+        self.window = app.config.get('WEBSOCKET_RATE_WINDOW', self.window)
+
+    @staticmethod
+    def room(user_id):
+        return f"user_{user_id}"
+
+    def connect(self, sid, user_id):
+        with self._lock:
+            self._sockets[sid] = user_id
+            self._rooms[user_id] = self._rooms.get(user_id, 0) + 1
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def disconnect(self, sid):
+        with self._lock:
+            user_id = self._sockets.pop(sid, None)
+            if user_id is None:
+                return
+            self._rooms[user_id] -= 1
+            if self._rooms[user_id] <= 0:
+                del self._rooms[user_id]
+                self._buckets.pop(user_id, None)
+
+    def increment(self, user_id, count=1):
+        with self._lock:
+            if user_id not in self._rooms:
+                return
+            second = int(time.monotonic())
+            buckets = self._buckets.setdefault(user_id, deque())
+            if buckets and buckets[-1][0] == second:
+                buckets[-1][1] += count
+            else:
+                buckets.append([second, count])
+
+    def _collect(self):
+        oldest = int(time.monotonic()) - self.window
+        rates = []
+        for user_id, buckets in list(self._buckets.items()):
+            while buckets and buckets[0][0] <= oldest:
+                buckets.popleft()
+            if not buckets:
+                del self._buckets[user_id]
+            rates.append((user_id, sum(count for _, count in buckets) / self.window))
+        return rates
+
+    def broadcast(self):
+        """Push the current rates once. Returns False (and ends the task) when no socket is left."""
+        with self._lock:
+            if not self._rooms:
+                self._task = None
+                return False
+            rates = self._collect()
+        date = datetime.now().strftime("%H:%M:%S")
+        for user_id, rate in rates:
+            self.socketio.emit(self.event, {'value': rate, 'date': date}, to=self.room(user_id))
+        return True
+
+    def _run(self):
+        interval = 1.0 / self.max_rate
+        while self.broadcast():
+            self.socketio.sleep(interval)
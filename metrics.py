@@ -0,0 +1,216 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return ','.join(pairs)
+
+
+def _sample(name, labels):
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, values, amount):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if amount <= bound:
+                series[index] += 1
+        series[-2] += amount
+        series[-1] += 1
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for values, series in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            prefix = labels + ',' if labels else ''
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_number(bound)}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{_sample(self.name + '_sum', labels)} {_number(series[-2])}")
+            lines.append(f"{_sample(self.name + '_count', labels)} {series[-1]}")
+
+
+class Counter:
+    def __init__(self, name, documentation, labels, kind='counter'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.kind = kind
+        self._series = {}
+
+    def inc(self, values, amount=1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def set(self, values, amount):
+        self._series[values] = amount
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        for values, amount in sorted(self._series.items()):
+            lines.append(f'{_sample(self.name, _labels(self.labels, values))} {_number(amount)}')
+
+
+class Metrics:
+    """Request, SQL and template timings of one process, served in the Prometheus text format.
+
+    Routes are labelled by their URL rule, so the number of series stays
+    bounded. Outbound HTTP numbers are read from the ``HttpClient`` when the
+    metrics are rendered.
+    """
+
+    def __init__(self, http=None):
+        self.http = http
+        self._lock = threading.Lock()
+        self.requests = Counter('paw_requests_total', 'Requests handled.', ('method', 'route', 'status'))
+        self.request_seconds = Histogram('paw_request_duration_seconds', 'Time spent handling a request.',
+                                         ('method', 'route'))
+        self.request_queries = Histogram('paw_request_sql_queries', 'SQL queries executed by one request.',
+                                         ('route',), QUERY_COUNT_BUCKETS)
+        self.request_sql_seconds = Histogram('paw_request_sql_duration_seconds',
+                                             'Time one request spent in SQL queries.', ('route',))
+        self.query_seconds = Histogram('paw_sql_query_duration_seconds', 'Duration of one SQL query.', ())
+        self.template_seconds = Histogram('paw_template_render_seconds', 'Time spent rendering a template.',
+                                          ('template',))
+
+    def init_app(self, app, engine):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        event.listen(engine, 'before_cursor_execute', self._start_query)
+        event.listen(engine, 'after_cursor_execute', self._finish_query)
+        before_render_template.connect(self._start_template, app)
+        template_rendered.connect(self._finish_template, app)
+        if app.config.get('METRICS_ENABLED', True):
+            app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        with self._lock:
+            self.requests.inc((request.method, route, response.status_code))
+            self.request_seconds.observe((request.method, route), seconds)
+            self.request_queries.observe((route,), g.sql_queries)
+            self.request_sql_seconds.observe((route,), g.sql_seconds)
+        return response
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['metrics_query_started'].pop()
+        with self._lock:
+            self.query_seconds.observe((), seconds)
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += seconds
+
+    def _start_template(self, sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def _finish_template(self, sender, template, context, **extra):
+        seconds = time.perf_counter() - g.metrics_templates.pop()
+        with self._lock:
+            self.template_seconds.observe((template.name,), seconds)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in (self.requests, self.request_seconds, self.request_queries, self.request_sql_seconds,
+                           self.query_seconds, self.template_seconds):
+                metric.render(lines)
+        if self.http is not None:
+            self._render_http(lines)
+        return '\n'.join(lines) + '\n'
+
+    def _render_http(self, lines):
+        stats = self.http.metrics()
+        gauges = Counter('paw_http_client_connections', 'Outbound HTTP pool size and requests in flight.',
+                         ('state',), kind='gauge')
+        gauges.set(('pool_size',), stats['pool_size'])
+        gauges.set(('in_flight',), stats['in_flight'])
+        gauges.set(('max_in_flight',), stats['max_in_flight'])
+        saturated = Counter('paw_http_client_saturated_total',
+                            'Outbound requests started while the pool was exhausted.', ())
+        saturated.set((), stats['saturated'])
+        count = Counter('paw_http_client_requests_total', 'Outbound HTTP requests.', ('endpoint',))
+        errors = Counter('paw_http_client_errors_total', 'Outbound HTTP requests that failed.', ('endpoint',))
+        seconds = Counter('paw_http_client_duration_seconds_total', 'Time spent in outbound HTTP requests.',
+                          ('endpoint',))
+        slowest = Counter('paw_http_client_max_duration_seconds', 'Slowest outbound HTTP request.',
+                          ('endpoint',), kind='gauge')
+        for endpoint, endpoint_stats in stats['endpoints'].items():
+            count.set((endpoint,), endpoint_stats['count'])
+            errors.set((endpoint,), endpoint_stats['errors'])
+            seconds.set((endpoint,), endpoint_stats['total_seconds'])
+            slowest.set((endpoint,), endpoint_stats['max_seconds'])
+        for metric in (gauges, saturated, count, errors, seconds, slowest):
+            metric.render(lines)
+
+    def view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+class RequestProfiler:
+    """Returns a cProfile report instead of the response for ``?profile=1`` requests of admins."""
+
+    def __init__(self, is_admin, rows=40):
+        self.is_admin = is_admin
+        self.rows = rows
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        if request.args.get('profile') == '1' and self.is_admin():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _finish(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        report = io.StringIO()
+        report.write(f"{request.method} {request.full_path} -> {response.status}\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(self.rows)
+        return Response(report.getvalue(), mimetype='text/plain')
@@ -0,0 +1,35 @@
+"""Upgrade the database of SQLALCHEMY_DATABASE_URI (from the environment or ``.env``) to the latest schema.
+
+    python migrate.py
+
+Only migrations the database has not seen yet are applied, so it is safe to
+run on every deploy. Stop the app first, the app refuses to start on an
+outdated schema.
+"""
+import os
+import sqlite3
+
+from dotenv import load_dotenv
+
+from migrations import LATEST_VERSION, database_path, upgrade
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+
+def migrate(uri=None):
+    """Apply pending migrations to the database of ``uri`` and return its path."""
+    load_dotenv()
+    path = database_path(uri or os.getenv("SQLALCHEMY_DATABASE_URI") or "sqlite:///paw.db", INSTANCE_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        for version, description in upgrade(connection):
+            print(f"Zastosowano migrację {version}: {description}")
+    finally:
+        connection.close()
+    print(f"Schemat bazy danych {path} jest w wersji {LATEST_VERSION}")
+    return path
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,92 @@
+import os
+
+from sqlalchemy.engine import make_url
+
+from jobs import JOB_SCHEMA
+from profile_pics import UPLOAD_SCHEMA
+from search import FTS_REBUILD, FTS_SCHEMA
+from sync import SYNC_BACKFILL, SYNC_SCHEMA
+from timeseries import SERIES_SCHEMA
+
+# Every migration is (version, description, statements). The schema version
+# of a database is kept in PRAGMA user_version, so upgrading an existing
+# paw.db only runs the migrations it has not seen yet.
+MIGRATIONS = [
+    (1, "user_info and note tables", [
+        """CREATE TABLE IF NOT EXISTS user_info
+           (user_id INTEGER PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            api_key VARCHAR(255) NOT NULL,
+            total_requests INTEGER DEFAULT 0,
+            last_request_timestamp DATETIME)""",
+        """CREATE TABLE IF NOT EXISTS note
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            text TEXT NOT NULL,
+            date_added DATETIME,
+            FOREIGN KEY (user_id) REFERENCES user_info(user_id))""",
+    ]),
+    (2, "full-text search index of notes", FTS_SCHEMA + [FTS_REBUILD]),
+    (3, "indexes for note listing and API key lookups", [
+        "CREATE INDEX IF NOT EXISTS ix_note_user_date ON note (user_id, date_added, id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_info_api_key ON user_info (api_key)",
+    ]),
+    (4, "per-user API rate limits", [
+        "ALTER TABLE user_info ADD COLUMN rate_limit FLOAT",
+        "ALTER TABLE user_info ADD COLUMN rate_burst INTEGER",
+    ]),
+    (5, "note revisions and tombstones for delta sync", SYNC_SCHEMA + SYNC_BACKFILL),
+    (6, "background job queue", JOB_SCHEMA),
+    (7, "per-minute, hourly and daily API usage rollups", SERIES_SCHEMA),
+    (8, "state of profile picture uploads", UPLOAD_SCHEMA),
+]
+
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def check_version(connection):
+    """Raise RuntimeError if the database of a sqlite3 connection misses migrations."""
+    version = current_version(connection)
+    if version < LATEST_VERSION:
+        raise RuntimeError(f"Database schema is at version {version}, the app needs {LATEST_VERSION}. "
+                           f"Upgrade it with: python migrate.py")
+
+
+def database_path(uri, instance_path):
+    """Path of the SQLite database of ``uri``; relative paths are in ``instance_path``, as in Flask-SQLAlchemy."""
+    path = make_url(uri).database
+    return path if os.path.isabs(path) else os.path.join(instance_path, path)
+
+
+def upgrade(connection, target=None):
+    """Apply pending migrations to a sqlite3 connection, each in its own transaction.
+
+    Returns ``(version, description)`` of every applied migration.
+    """
+    applied = []
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None
+    try:
+        version = current_version(connection)
+        for number, description, statements in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            connection.execute("BEGIN")
+            try:
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {number}")
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            applied.append((number, description))
+    finally:
+        connection.isolation_level = isolation_level
+    return applied
@@ -0,0 +1,47 @@
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+
+class NoteListCache:
+    """ETags of a user's note list and the rendered note table, keyed by a note list version.
+
+    The version is ``user_info.change_seq``, which the note_sync_* triggers
+    (see sync.py) advance on every committed write to a note, whatever
+    process or statement made it. Callers read it before reading the notes,
+    so a response can be newer than its version but never older. ETags also
+    carry a random per-process epoch, so a deploy with changed templates
+    never answers 304 with a page rendered by the old ones.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.epoch = secrets.token_hex(4)
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('NOTE_FRAGMENT_CACHE_SIZE', self.maxsize)
+
+    def etag(self, user_id, version, *parts):
+        key = '\0'.join(str(part) for part in parts)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return f"{self.epoch}-{user_id}-{version}-{digest}"
+
+    def fragment(self, user_id, version, render):
+        """Return the rendered note table of the user at ``version``, calling ``render()`` on a miss."""
+        with self._lock:
+            cached = self._fragments.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._fragments.move_to_end(user_id)
+                return cached[1]
+        html = render()
+        with self._lock:
+            cached = self._fragments.get(user_id)
+            if cached is None or cached[0] < version:
+                self._fragments[user_id] = (version, html)
+                self._fragments.move_to_end(user_id)
+                while len(self._fragments) > self.maxsize:
+                    self._fragments.popitem(last=False)
+        return html
@@ -0,0 +1,69 @@
+import base64
+import binascii
+import json
+
+from sqlalchemy import String, and_, or_, type_coerce
+
+
+def encode_cursor(date_added, note_id):
+    # date_added is the text SQLite stores (or None), not a datetime: rows
+    # written in other formats, like '2023-01-01', must compare equal to it.
+    raw = json.dumps([date_added, note_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date_added, note_id = json.loads(raw)
+        if not (date_added is None or isinstance(date_added, str)) or not isinstance(note_id, int):
+            raise ValueError
+        return date_added, note_id
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value, default, maximum):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, maximum)
+
+
+def parse_fields(value, allowed):
+    if not value:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields requested')
+    return [field for field in allowed if field in fields]
+
+
+def keyset_page(query, date_column, id_column, cursor, limit):
+    """Return ``limit`` rows after ``cursor`` ordered by ``(date, id)`` and the next cursor.
+
+    Dates are compared as stored, without conversion to datetime, and rows
+    without a date come first, as SQLite sorts NULL before any value.
+    """
+    stored_date = type_coerce(date_column, String)
+    if cursor is not None:
+        date_added, note_id = cursor
+        if date_added is None:
+            query = query.filter(or_(date_column.is_not(None), id_column > note_id))
+        else:
+            query = query.filter(or_(stored_date > date_added,
+                                     and_(stored_date == date_added, id_column > note_id)))
+    rows = query.add_columns(stored_date.label('cursor_date')) \
+        .order_by(date_column, id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.cursor_date, last.id)
+    return rows, next_cursor
@@ -0,0 +1,243 @@
+import atexit
+import io
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import quote
+
+from PIL import Image, ImageOps
+from sqlalchemy import text
+
+UPLOAD_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS profile_pic_upload
+       (user_id INTEGER PRIMARY KEY,
+        status VARCHAR(16) NOT NULL,
+        error TEXT,
+        updated_at FLOAT NOT NULL)""",
+]
+
+PicInfo = namedtuple('PicInfo', ['exists', 'etag', 'size'])
+
+MISSING = PicInfo(False, None, None)
+
+
+def profile_pic_name(user_id, variant=None):
+    suffix = f"_{variant}" if variant else ""
+    return f"images/profile_pic_{user_id}{suffix}.jpg"
+
+
+def encode_jpeg(image, size, quality=85):
+    """Downscale ``image`` to fit in a ``size`` x ``size`` box and encode it as JPEG."""
+    image = image.copy()
+    image.thumbnail((size, size))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    output.seek(0)
+    return output
+
+
+class FirebaseStorageBackend:
+    """Profile pictures kept in Firebase Storage.
+
+    ``stat`` asks for the object metadata, which is a small JSON document,
+    instead of downloading the picture itself. Every operation uses its own
+    pyrebase ``Storage`` object, because ``child()`` keeps the path on it.
+    """
+
+    def __init__(self, firebase, bucket, http, timeout=3.0):
+        self.firebase = firebase
+        self.bucket = bucket
+        self.http = http
+        self.timeout = timeout
+
+    def url(self, name):
+        return f"https://firebasestorage.googleapis.com/v0/b/{self.bucket}/o/{quote(name, safe='')}"
+
+    def stat(self, name):
+        response = self.http.get(self.url(name), timeout=self.timeout)
+        if response.status_code == 404:
+            return MISSING
+        response.raise_for_status()
+        return self._info(response.json())
+
+    def upload(self, name, stream, token=None):
+        return self._info(self.firebase.storage().child(name).put(stream, token))
+
+    def download(self, name, filename):
+        self.firebase.storage().child(name).download(path="", filename=filename)
+
+    @staticmethod
+    def _info(metadata):
+        return PicInfo(True, metadata.get('etag') or metadata.get('md5Hash'), int(metadata.get('size', 0)))
+
+
+class LocalStorageBackend:
+    """Stand-in for Firebase Storage keeping the pictures in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def stat(self, name):
+        try:
+            result = os.stat(self.path(name))
+        except FileNotFoundError:
+            return MISSING
+        return PicInfo(True, f"{result.st_mtime_ns:x}-{result.st_size:x}", result.st_size)
+
+    def upload(self, name, stream, token=None):
+        target = self.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        return self.stat(name)
+
+    def download(self, name, filename):
+        shutil.copyfile(self.path(name), filename)
+
+
+class ProfilePicCache:
+    """Remembers per user whether a profile picture exists, with its etag and size.
+
+    The storage backend is only asked on a miss. Missing pictures are
+    remembered for a shorter time than existing ones.
+    """
+
+    def __init__(self, backend=None, ttl=3600, negative_ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PROFILE_PIC_CACHE_TTL', self.ttl)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        try:
+            info = self.backend.stat(profile_pic_name(user_id))
+        except Exception as e:
+            print(e)
+            return entry[0] if entry is not None else MISSING
+        self.set(user_id, info)
+        return info
+
+    def exists(self, user_id):
+        return self.get(user_id).exists
+
+    def set(self, user_id, info):
+        ttl = self.ttl if info.exists else self.negative_ttl
+        with self._lock:
+            self._entries[user_id] = (info, time.monotonic() + ttl)
+
+    def upload(self, user_id, stream, token=None, variant=None):
+        info = self.backend.upload(profile_pic_name(user_id, variant), stream, token)
+        if variant is None:
+            self.set(user_id, info)
+        return info
+
+    def download(self, user_id, filename):
+        self.backend.download(profile_pic_name(user_id), filename)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class ProfilePicUploader:
+    """Resizes uploaded profile pictures and sends them to storage in the background.
+
+    The request thread only copies the upload into a spooled buffer and
+    checks that it is an image. A worker pool then re-encodes it to at most
+    ``max_size`` pixels, adds a ``thumb`` variant and uploads both. The
+    state of the last upload of every user is kept in the
+    ``profile_pic_upload`` table of ``db``, so any worker process can tell
+    the user how it went, see ``result``.
+    """
+
+    def __init__(self, pics, db=None, max_size=512, thumb_size=64, workers=2, spool_size=1024 * 1024):
+        self.pics = pics
+        self.db = db
+        self.max_size = max_size
+        self.thumb_size = thumb_size
+        self.workers = workers
+        self.spool_size = spool_size
+        self.app = None
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_size = app.config.get('PROFILE_PIC_MAX_SIZE', self.max_size)
+        self.thumb_size = app.config.get('PROFILE_PIC_THUMB_SIZE', self.thumb_size)
+        self.workers = app.config.get('PROFILE_PIC_WORKERS', self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='profile-pic')
+        atexit.register(self._executor.shutdown)
+
+    def submit(self, user_id, stream, token=None):
+        spool = SpooledTemporaryFile(max_size=self.spool_size)
+        shutil.copyfileobj(stream, spool)
+        spool.seek(0)
+        try:
+            Image.open(spool)
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        self.pics.invalidate(user_id)
+        self._set_status(user_id, 'uploading')
+        return self._executor.submit(self._process, user_id, spool, token)
+
+    def result(self, user_id):
+        """Return ``(status, error)`` of the user's last upload, forgetting it once it is done or failed.
+
+        The status is ``uploading``, ``done`` or ``failed``. Returns None if
+        there is no upload to report.
+        """
+        if self.db is None:
+            return None
+        with self.app.app_context(), self.db.engine.begin() as connection:
+            row = connection.execute(text("SELECT status, error FROM profile_pic_upload WHERE user_id = :user_id"),
+                                     {'user_id': user_id}).first()
+            if row is not None and row.status != 'uploading':
+                connection.execute(text("DELETE FROM profile_pic_upload WHERE user_id = :user_id"),
+                                   {'user_id': user_id})
+        return tuple(row) if row else None
+
+    def _process(self, user_id, spool, token):
+        try:
+            with spool:
+                image = ImageOps.exif_transpose(Image.open(spool)).convert('RGB')
+            # The thumbnail goes first: cached variants are keyed by the full size picture's etag,
+            # so it must not change before every variant is in place.
+            self.pics.upload(user_id, encode_jpeg(image, self.thumb_size), token, variant='thumb')
+            self.pics.upload(user_id, encode_jpeg(image, self.max_size), token)
+        except Exception as e:
+            self.app.logger.exception("Profile picture upload of user %s failed", user_id)
+            self._set_status(user_id, 'failed', repr(e))
+            raise
+        self._set_status(user_id, 'done')
+
+    def _set_status(self, user_id, status, error=None):
+        if self.db is None:
+            return
+        try:
+            with self.app.app_context(), self.db.engine.begin() as connection:
+                connection.execute(text("""
+                    INSERT INTO profile_pic_upload (user_id, status, error, updated_at)
+                    VALUES (:user_id, :status, :error, :now)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET status = excluded.status, error = excluded.error, updated_at = excluded.updated_at
+                """), {'user_id': user_id, 'status': status, 'error': error, 'now': time.time()})
+        except Exception:
+            self.app.logger.exception("Could not record the profile picture upload of user %s", user_id)
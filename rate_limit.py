@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+RateLimit = namedtuple('RateLimit', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+
+class MemoryBucketStore:
+    """Token buckets of one process, bounded to ``maxsize`` least recently used keys.
+
+    An evicted key simply starts again with a full bucket.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """Refill the bucket of ``key`` and take one token. Returns ``(allowed, tokens_left)``."""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis.
+
+    ``client`` is a ``redis.Redis`` instance; the refill and take run as one
+    Lua script, so concurrent workers cannot both spend the last token.
+    """
+
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, now):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, burst, now])
+        return bool(allowed), float(tokens)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+class RateLimiter:
+    """Per-API-key token bucket: ``rate`` requests per second with bursts of up to ``burst``.
+
+    The default limits can be overridden per user; a rate of 0 (or a burst
+    below 1) blocks the key. If the store fails the request is let through.
+    """
+
+    def __init__(self, store=None, rate=10.0, burst=20):
+        self.store = store or MemoryBucketStore()
+        self.rate = rate
+        self.burst = burst
+        self.enabled = True
+
+    def init_app(self, app):
+        self.rate = app.config.get('RATE_LIMIT_RATE', self.rate)
+        self.burst = app.config.get('RATE_LIMIT_BURST', self.burst)
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', self.enabled)
+
+    def hit(self, key, rate=None, burst=None, now=None):
+        rate = self.rate if rate is None else rate
+        burst = self.burst if burst is None else burst
+        if rate <= 0 or burst < 1:
+            return RateLimit(False, 0, 0, 0, None)
+        now = time.time() if now is None else now
+        try:
+            allowed, tokens = self.store.take(key, rate, burst, now)
+        except Exception as e:
+            print(e)
+            return None
+        reset = math.ceil((burst - tokens) / rate)
+        retry_after = 0 if allowed else math.ceil((1 - tokens) / rate)
+        return RateLimit(allowed, burst, int(tokens), reset, retry_after)
+
+    @staticmethod
+    def headers(limit):
+        headers = {
+            'X-RateLimit-Limit': str(limit.limit),
+            'X-RateLimit-Remaining': str(limit.remaining),
+            'X-RateLimit-Reset': str(limit.reset),
+        }
+        if limit.retry_after is not None and not limit.allowed:
+            headers['Retry-After'] = str(limit.retry_after)
+        return headers
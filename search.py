@@ -0,0 +1,69 @@
+import re
+
+from markupsafe import escape
+from sqlalchemy import Float, Integer, String, DateTime, column, text
+
+from serializers import DATE_FORMAT
+
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS note_fts
+       USING fts5(title, text, content='note', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_insert AFTER INSERT ON note BEGIN
+           INSERT INTO note_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_delete AFTER DELETE ON note BEGIN
+           INSERT INTO note_fts(note_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_update AFTER UPDATE OF title, text ON note BEGIN
+           INSERT INTO note_fts(note_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+           INSERT INTO note_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+       END""",
+]
+
+FTS_REBUILD = "INSERT INTO note_fts(note_fts) VALUES ('rebuild')"
+
+# Title matches weigh more than matches in the note body.
+_RANK = "bm25(note_fts, 10.0, 1.0)"
+
+# snippet() wraps matches in these, highlight() turns them into <mark> tags once the note text is escaped.
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query matching all of its words.
+
+    Every word is quoted, so characters with a meaning in the FTS5 query
+    syntax are searched for literally.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def highlight(snippet):
+    """HTML of a snippet returned by search_notes(): the note text escaped and the matches in <mark> tags."""
+    return str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_notes(session, user_id, query, limit, offset=0, snippets=False):
+    """Return one page of the user's notes matching ``query`` ordered by rank and the next offset."""
+    match = build_match_query(query)
+    if not match:
+        return [], None
+    snippet = f", snippet(note_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet" if snippets else ""
+    statement = text(f"""
+        SELECT note.id, note.title, note.text, note.date_added,
+               strftime('{DATE_FORMAT}', note.date_added) AS date_text, {_RANK} AS rank{snippet}
+        FROM note_fts JOIN note ON note.id = note_fts.rowid
+        WHERE note_fts MATCH :match AND note.user_id = :user_id
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """).columns(column('id', Integer), column('title', String), column('text', String),
+                 column('date_added', DateTime), column('date_text', String), column('rank', Float),
+                 *([column('snippet', String)] if snippets else []))
+    rows = session.execute(statement, {'match': match, 'user_id': user_id,
+                                       'limit': limit + 1, 'offset': offset}).all()
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    return rows, next_offset
@@ -0,0 +1,72 @@
+import gzip
+
+import brotli
+import msgpack
+import orjson
+from flask import current_app, make_response, request
+from sqlalchemy import func
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+# Strings the notes API sends dates as; the same codes work in SQLite's strftime().
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def sql_date(column):
+    """Format a date column in the query instead of calling strftime() per row in Python."""
+    return func.strftime(DATE_FORMAT, column)
+
+
+class Serializers:
+    """Response encoders of the notes API, picked by the Accept header.
+
+    JSON is encoded with orjson and MessagePack is offered for
+    ``Accept: application/msgpack``. Bodies of at least the app's
+    API_COMPRESS_MIN_SIZE (default ``min_size``) bytes are compressed with
+    brotli or gzip, whichever the client prefers in Accept-Encoding.
+    Compressing turns the ETag weak, as the bytes differ from the
+    uncompressed representation.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.mediatypes = [JSON]
+
+    def init_app(self, app, api):
+        api.representations[JSON] = self.output_json
+        api.representations[MSGPACK] = self.output_msgpack
+        api.representations['application/x-msgpack'] = self.output_msgpack
+        self.mediatypes = list(api.representations)
+
+    def mediatype(self):
+        """The representation a response to the current request will use."""
+        return request.accept_mimetypes.best_match(self.mediatypes, default=JSON)
+
+    def output_json(self, data, code, headers=None):
+        return self._response(orjson.dumps(data), code, headers)
+
+    def output_msgpack(self, data, code, headers=None):
+        return self._response(msgpack.packb(data), code, headers)
+
+    def _response(self, body, code, headers):
+        response = make_response(body, code)
+        response.headers.extend(headers or {})
+        response.vary.add('Accept')
+        response.vary.add('Accept-Encoding')
+        if len(body) < current_app.config.get('API_COMPRESS_MIN_SIZE', self.min_size):
+            return response
+        encoding = request.accept_encodings.best_match(['br', 'gzip'])
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=self.brotli_quality))
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(body, self.gzip_level))
+        else:
+            return response
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+# Pragmas applied to every new connection of the engine, per profile.
+PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+}
+
+
+def engine_options(profile, pool_size=10, max_overflow=20, pool_timeout=30):
+    """SQLAlchemy engine options for a SQLite database under the given profile."""
+    pragmas = PROFILES[profile]
+    options = {'connect_args': {'check_same_thread': False}}
+    if 'busy_timeout' in pragmas:
+        options['connect_args']['timeout'] = pragmas['busy_timeout'] / 1000
+    if profile != 'default':
+        options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    return options
+
+
+def install(engine, profile):
+    """Run the pragmas of ``profile`` on every connection ``engine`` opens."""
+    pragmas = PROFILES[profile]
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
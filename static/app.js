@@ -4,18 +4,14 @@ $(document).ready(function () {
   const apiKeyChart = new Chart(ctx, {
     type: "line",
     data: {
-      datasets: [{ label: "Żądania",  }],
+      datasets: [{ label: "Żądania/s",  }],
     },
     options: {
       scales: {
         y: {
           ticks: {
-            stepSize: 1,
             callback: function (value, index, values) {
-              if (Number.isInteger(value)) {
-                return value;
-              }
-              return '';
+              return value.toFixed(1);
             },
           },
         },
@@ -40,6 +36,27 @@ $(document).ready(function () {
     });
   }
 
+  const historyCanvas = document.getElementById("historyChart");
+  const historyChart = new Chart(historyCanvas.getContext("2d"), {
+    type: "bar",
+    data: {
+      datasets: [{ label: "Żądania/min", backgroundColor: 'rgb(255,0,0)' }],
+    },
+  });
+
+  function loadHistory() {
+    $.getJSON("/stats", { resolution: "minute" }, function (stats) {
+      historyChart.data.labels = stats.points.map((point) =>
+        new Date(point[0] * 1000).toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" })
+      );
+      historyChart.data.datasets[0].data = stats.points.map((point) => point[1]);
+      historyChart.update();
+    });
+  }
+
+  loadHistory();
+  setInterval(loadHistory, 60000);
+
   const MAX_DATA_COUNT = 10;
   const socket = io.connect();
 
@@ -0,0 +1,70 @@
+from sqlalchemy import Integer, String, column, text
+
+from serializers import DATE_FORMAT
+
+# Every write to a note takes the next number of its owner's change sequence
+# (user_info.change_seq) as its revision; deleted notes leave a tombstone
+# with the revision of the deletion. Triggers keep this up to date for every
+# writer (ORM, batch statements and the ASGI handlers).
+_NOW = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+_NEXT_REVISION = "COALESCE((SELECT change_seq FROM user_info WHERE user_id = {}.user_id), 0)"
+
+SYNC_SCHEMA = [
+    "ALTER TABLE note ADD COLUMN updated_at DATETIME",
+    "ALTER TABLE note ADD COLUMN revision INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE user_info ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0",
+    """CREATE TABLE IF NOT EXISTS note_tombstone
+       (id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        note_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        deleted_at DATETIME)""",
+    "CREATE INDEX IF NOT EXISTS ix_note_tombstone_user_revision ON note_tombstone (user_id, revision)",
+    f"""CREATE TRIGGER IF NOT EXISTS note_sync_insert AFTER INSERT ON note BEGIN
+           UPDATE user_info SET change_seq = change_seq + 1 WHERE user_id = new.user_id;
+           UPDATE note SET revision = {_NEXT_REVISION.format('new')}, updated_at = {_NOW} WHERE id = new.id;
+       END""",
+    f"""CREATE TRIGGER IF NOT EXISTS note_sync_update AFTER UPDATE OF user_id, title, text ON note BEGIN
+           UPDATE user_info SET change_seq = change_seq + 1 WHERE user_id = new.user_id;
+           UPDATE note SET revision = {_NEXT_REVISION.format('new')}, updated_at = {_NOW} WHERE id = new.id;
+       END""",
+    f"""CREATE TRIGGER IF NOT EXISTS note_sync_delete AFTER DELETE ON note BEGIN
+           UPDATE user_info SET change_seq = change_seq + 1 WHERE user_id = old.user_id;
+           INSERT INTO note_tombstone (user_id, note_id, revision, deleted_at)
+           VALUES (old.user_id, old.id, {_NEXT_REVISION.format('old')}, {_NOW});
+       END""",
+]
+
+# Existing notes get revisions 1..n per user in id order.
+SYNC_BACKFILL = [
+    f"""UPDATE note SET revision = numbered.revision, updated_at = COALESCE(note.date_added, {_NOW})
+       FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS revision FROM note) AS numbered
+       WHERE note.id = numbered.id""",
+    "CREATE INDEX IF NOT EXISTS ix_note_user_revision ON note (user_id, revision)",
+    """UPDATE user_info SET change_seq =
+       (SELECT COALESCE(MAX(revision), 0) FROM note WHERE note.user_id = user_info.user_id)""",
+]
+
+
+def changes_since(session, user_id, since, limit):
+    """Return up to ``limit`` changes of the user after revision ``since`` and whether more are waiting.
+
+    Rows are ordered by ``seq``; a deleted note has ``deleted`` set and only
+    its ``id``. A note changed several times only shows up with its latest
+    revision. Dates come back formatted as strings.
+    """
+    statement = text(f"""
+        SELECT * FROM (
+            SELECT revision AS seq, id, title, text, strftime('{DATE_FORMAT}', date_added),
+                   strftime('{DATE_FORMAT}', updated_at), 0 AS deleted FROM note
+            WHERE user_id = :user_id AND revision > :since ORDER BY revision LIMIT :limit)
+        UNION ALL
+        SELECT * FROM (
+            SELECT revision, note_id, NULL, NULL, NULL, deleted_at, 1 FROM note_tombstone
+            WHERE user_id = :user_id AND revision > :since ORDER BY revision LIMIT :limit)
+        ORDER BY seq
+        LIMIT :limit
+    """).columns(column('seq', Integer), column('id', Integer), column('title', String), column('text', String),
+                 column('date_added', String), column('updated_at', String), column('deleted', Integer))
+    rows = session.execute(statement, {'user_id': user_id, 'since': since, 'limit': limit + 1}).all()
+    return rows[:limit], len(rows) > limit
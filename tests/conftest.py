@@ -0,0 +1,42 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Return a function building a Flask app and SQLite database from ``schema``, as ``(app, db)``."""
+    def create(schema):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'paw.db'}"
+        db = SQLAlchemy(app)
+        with app.app_context():
+            connection = db.engine.raw_connection()
+            for statement in schema:
+                connection.execute(statement)
+            connection.commit()
+            connection.close()
+        return app, db
+    return create
+
+
+@pytest.fixture
+def paw_app(tmp_path):
+    """Return a function building the application on a new migrated database called ``name``."""
+    from app import create_app
+    from migrate import migrate
+
+    def create(name='paw', **config):
+        path = migrate(f"sqlite:///{tmp_path / name}.db")
+        return create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}",
+            'SECRET_KEY': 'test',
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'PROFILE_PIC_LOCAL_ROOT': str(tmp_path / name / 'profile_pics'),
+            'AVATAR_CACHE_DIR': str(tmp_path / name / 'avatars'),
+            'JOBS_WORKERS': 0,
+            **config,
+        })
+    return create
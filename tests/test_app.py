@@ -1,25 +1,35 @@
-import os
-import tempfile
+import orjson
 import pytest
 from random import randrange
 
-from app import app, User
+from app import create_app, User
 
-with app.app_context():
-    user = User.query.first()
-    api_key = user.api_key
-    email = user.email
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app({'TESTING': True, 'WTF_CSRF_ENABLED': False})
+
+
+@pytest.fixture(scope='module')
+def user(app):
+    with app.app_context():
+        user = User.query.first()
+        return user.api_key, user.email
+
+
+@pytest.fixture
+def api_key(user):
+    return user[0]
 
 
 @pytest.fixture
-def client():
-    db_fd, app.config['SQLALCHEMY_DATABASE_URI'] = tempfile.mkstemp()
-    app.config['TESTING'] = True
-    app.config['WTF_CSRF_ENABLED'] = False
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-    client = app.test_client()
+def email(user):
+    return user[1]
+
 
-    yield client
+@pytest.fixture
+def client(app):
+    return app.test_client()
 
 
 def test_login_page(client):
@@ -34,20 +44,20 @@ def test_invalid_login(client):
     assert b'lub takie konto z takim adresem email nie istnieje.' in response.data
 
 
-def test_valid_login(client):
+def test_valid_login(client, email):
     response = client.post('/', data=dict(email=email, password='adminn'))
     assert response.status_code == 200
     assert b'Dodaj notatk' in response.data
 
 
-def test_signup(client):
+def test_signup(client, email):
     response = client.post('/signup', data=dict(email=(str(randrange(9999)) + email), password='password',
                                                 password2='password'), follow_redirects=True)
     assert response.status_code == 200
     assert b'Utworzono konto' in response.data
 
 
-def test_forgot_password(client):
+def test_forgot_password(client, email):
     client.post('/signup', data=dict(email=email, password='password',
                                      password2='password'), follow_redirects=True)
     response = client.post('/forgot', data=dict(email=email), follow_redirects=True)
@@ -55,8 +65,8 @@ def test_forgot_password(client):
     assert b'dalsze instrukcje.' in response.data
 
 
-def test_update_profile_pic(client):
-    test_valid_login(client)
+def test_update_profile_pic(client, email):
+    test_valid_login(client, email)
     with client.session_transaction() as session:
         session['user'] = email
 
@@ -67,7 +77,7 @@ def test_update_profile_pic(client):
     assert b'Dodano zdj' in response.data
 
 
-def test_download_profile_pic(client):
+def test_download_profile_pic(client, email):
     with client.session_transaction() as session:
         session['user'] = email
 
@@ -80,13 +90,37 @@ def test_download_profile_pic(client):
     assert b'Pobrano' in response.data
 
 
-def test_get_notes_rest(client):
+def test_get_notes_rest(client, api_key):
     response = client.get(f'/notes?api_key={api_key}')
     assert response.status_code == 200
-    assert b'{"notes": [' in response.data
+    assert isinstance(response.json['notes'], list)
 
 
-def test_get_note_rest(client):
+def test_get_notes_rest_not_modified(client, api_key):
+    response = client.get(f'/notes?api_key={api_key}')
+    etag = response.headers.get('ETag')
+    assert etag
+
+    response = client.get(f'/notes?api_key={api_key}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_get_notes_rest_paginated(client, api_key):
+    response = client.get(f'/notes?api_key={api_key}&limit=1&fields=id,title')
+    assert response.status_code == 200
+    notes = response.json.get('notes')
+    assert len(notes) <= 1
+    for note in notes:
+        assert set(note) == {'id', 'title'}
+
+    cursor = response.json.get('next_cursor')
+    if cursor:
+        response = client.get(f'/notes?api_key={api_key}&limit=1&cursor={cursor}')
+        assert response.status_code == 200
+        assert response.json.get('notes')[0]['id'] != notes[0]['id']
+
+
+def test_get_note_rest(client, api_key):
     response = client.get(f'/notes?api_key={api_key}')
     notes = response.json.get('notes')
 
@@ -98,10 +132,31 @@ def test_get_note_rest(client):
 
         response = client.get(f'/notes/{note_id}?api_key={api_key}')
         assert response.status_code == 200
-        assert b'"date_added": "' in response.data
+        assert isinstance(response.json['date_added'], str)
+
+
+def test_export_rest(client, api_key):
+    response = client.get(f'/notes/export?api_key={api_key}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    for line in response.data.splitlines():
+        assert isinstance(orjson.loads(line)['date_added'], str)
+
+
+def test_search_rest(client, api_key):
+    data = {
+        "title": "Searchable Note",
+        "text": "This note contains a unique word zebrafish"
+    }
+    client.post(f'/notes?api_key={api_key}', json=data)
+    response = client.get(f'/notes/search?api_key={api_key}&q=zebrafish&snippets=1')
+    assert response.status_code == 200
+    notes = response.json.get('notes')
+    assert len(notes) > 0
+    assert b'<mark>zebrafish</mark>' in response.data
 
 
-def test_post_rest(client):
+def test_post_rest(client, api_key):
     data = {
         "title": "Test Note",
         "text": "This is a test note"
@@ -110,10 +165,45 @@ def test_post_rest(client):
                            follow_redirects=True)
     assert response.status_code == 200
 
-    assert b'{"title": "Test Note",' in response.data
+    assert response.json == data
+
+
+def test_batch_rest(client, api_key):
+    data = {
+        "operations": [
+            {"op": "create", "title": "Batch Note", "text": "Created in a batch"},
+            {"op": "delete", "id": -1},
+        ]
+    }
+    response = client.post(f'/notes/batch?api_key={api_key}', json=data)
+    assert response.status_code == 200
+    created, missing = response.json.get('results')
+    assert created['status'] == 201
+    assert missing['status'] == 404
+
+    data = {"operations": [{"op": "delete", "id": created['id']}]}
+    response = client.post(f'/notes/batch?api_key={api_key}', json=data)
+    assert response.json.get('results')[0]['status'] == 200
+
+
+def test_changes_rest(client, api_key):
+    since = 0
+    while True:
+        response = client.get(f'/notes/changes?api_key={api_key}&since={since}&limit=1000')
+        assert response.status_code == 200
+        since = response.json.get('next_since')
+        if not response.json.get('has_more'):
+            break
+
+    data = {"operations": [{"op": "create", "title": "Synced Note", "text": "Created after the sync"}]}
+    note_id = client.post(f'/notes/batch?api_key={api_key}', json=data).json.get('results')[0]['id']
+    client.delete(f'/notes/{note_id}?api_key={api_key}')
+
+    response = client.get(f'/notes/changes?api_key={api_key}&since={since}')
+    assert response.json.get('changes') == [{'seq': since + 2, 'op': 'delete', 'id': note_id}]
 
 
-def test_put_rest(client):
+def test_put_rest(client, email, api_key):
     with client.session_transaction() as session:
         session['user'] = email
     response = client.get(f'/notes?api_key={api_key}')
@@ -136,7 +226,7 @@ def test_put_rest(client):
         assert b'This note has been updated' in response.data
 
 
-def test_delete_rest(client):
+def test_delete_rest(client, email, api_key):
     with client.session_transaction() as session:
         session['user'] = email
 
@@ -150,7 +240,7 @@ def test_delete_rest(client):
 
         response = client.delete(f'/notes/{note_id}?api_key={api_key}', follow_redirects=True)
         assert response.status_code == 200
-        assert b'"message": "Note deleted!"' in response.data
+        assert response.json == {"message": "Note deleted!"}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+from urllib.parse import urlencode
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+from starlette.testclient import TestClient  # noqa: E402
+
+from migrate import migrate  # noqa: E402
+
+NOTES = [
+    # Dates as db_init.py seeds them, as SQLAlchemy writes them and missing.
+    (1, 'Pierwsza', 'jeden', '2023-01-01'),
+    (2, 'Druga', 'dwa', '2023-02-27'),
+    (3, 'Trzecia', 'trzy', None),
+    (4, 'Czwarta', 'cztery', '2023-02-27 10:00:00.000000'),
+    (5, 'Piąta', 'pięć', '2023-02-27'),
+]
+
+
+@pytest.fixture(scope='module')
+def clients(tmp_path_factory):
+    path = migrate(f"sqlite:///{tmp_path_factory.mktemp('asgi') / 'paw.db'}")
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'a@example.com', 'key')")
+    connection.execute("INSERT INTO user_info (user_id, email, api_key, rate_limit, rate_burst) "
+                       "VALUES (2, 'b@example.com', 'slow', 0.001, 2)")
+    connection.executemany("INSERT INTO note (id, user_id, title, text, date_added) VALUES (?, 1, ?, ?, ?)", NOTES)
+    connection.commit()
+    connection.close()
+
+    # asgi.py builds its Flask app from the environment when imported.
+    environ = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}", 'SECRET_KEY': 'test', 'RATE_LIMIT_ENABLED': '1',
+               'RATE_LIMIT_BURST': '1000', 'METRICS_ENABLED': '0'}
+    previous = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        import asgi
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name)
+            else:
+                os.environ[name] = value
+    with TestClient(asgi.app) as asgi_client:
+        yield asgi.flask_app.test_client(), asgi_client
+
+
+def both(clients, method, path, headers=None, **params):
+    """Send the same request to the Flask resource and to the ASGI handler; returns ``(status, body)`` of each."""
+    flask_client, asgi_client = clients
+    url = f"{path}?{urlencode({'api_key': 'key', **params})}"
+    flask = getattr(flask_client, method)(url, headers=headers)
+    asgi = getattr(asgi_client, method)(url, headers=headers)
+    return ((flask.status_code, flask.get_json(silent=True), flask.headers),
+            (asgi.status_code, asgi.json() if asgi.content else None, asgi.headers))
+
+
+def test_pages_and_cursors_match(clients):
+    cursor, pages = None, []
+    while True:
+        (flask_status, flask, _), (asgi_status, asgi, _) = both(
+            clients, 'get', '/notes', limit=2, **({'cursor': cursor} if cursor else {}))
+        assert flask_status == asgi_status == 200
+        assert flask == asgi
+        pages.append([note['id'] for note in asgi['notes']])
+        cursor = asgi['next_cursor']
+        if cursor is None:
+            break
+    assert pages == [[3, 1], [2, 5], [4]]
+    assert asgi['notes'][0]['date_added'] == '2023-02-27 10:00:00'
+
+    flask, asgi = both(clients, 'get', '/notes', fields='title,date_added')
+    assert flask[1] == asgi[1]
+    assert set(asgi[1]['notes'][0]) == {'title', 'date_added'}
+
+
+@pytest.mark.parametrize('params', [{'limit': 0}, {'limit': 'x'}, {'cursor': 'broken'}, {'fields': 'owner'}])
+def test_invalid_parameters_match(clients, params):
+    flask, asgi = both(clients, 'get', '/notes', **params)
+    assert flask[:2] == asgi[:2]
+    assert asgi[0] == 400
+
+
+def test_single_note_and_errors_match(clients):
+    flask, asgi = both(clients, 'get', '/notes/1')
+    assert flask[:2] == asgi[:2] == (200, {'id': 1, 'title': 'Pierwsza', 'text': 'jeden',
+                                            'date_added': '2023-01-01 00:00:00'})
+    assert both(clients, 'get', '/notes/999')[0][:2] == both(clients, 'get', '/notes/999')[1][:2]
+    flask, asgi = both(clients, 'get', '/notes/1', api_key='wrong')
+    assert flask[:2] == asgi[:2] == (401, {'message': 'Unauthorized api key'})
+
+
+def test_writes_match(clients):
+    flask_client, asgi_client = clients
+    note = {'title': 'Nowa', 'text': 'treść'}
+    flask = flask_client.post('/notes?api_key=key', json=note)
+    asgi = asgi_client.post('/notes?api_key=key', json=note)
+    assert (flask.status_code, flask.json) == (asgi.status_code, asgi.json()) == (200, note)
+
+    ids = [row['id'] for row in asgi_client.get('/notes?api_key=key&fields=id,title').json()['notes']
+           if row['title'] == 'Nowa']
+    update = {'title': 'Zmieniona', 'text': 'inna'}
+    flask = flask_client.put(f'/notes/{ids[0]}?api_key=key', json=update)
+    asgi = asgi_client.put(f'/notes/{ids[1]}?api_key=key', json=update)
+    assert (flask.status_code, flask.json) == (asgi.status_code, asgi.json()) == (200, update)
+
+    flask = flask_client.delete(f'/notes/{ids[0]}?api_key=key')
+    asgi = asgi_client.delete(f'/notes/{ids[1]}?api_key=key')
+    assert (flask.status_code, flask.json) == (asgi.status_code, asgi.json()) == (200, {'message': 'Note deleted!'})
+    flask, asgi = both(clients, 'delete', f'/notes/{ids[0]}')
+    assert flask[:2] == asgi[:2] == (404, {'message': 'Note not found'})
+
+
+def test_not_modified_until_any_server_writes(clients):
+    flask_client, asgi_client = clients
+    flask, asgi = both(clients, 'get', '/notes')
+    flask_etag, asgi_etag = flask[2]['ETag'], asgi[2]['ETag']
+    flask, asgi = both(clients, 'get', '/notes', headers={'If-None-Match': flask_etag})
+    assert flask[0] == 304
+    flask, asgi = both(clients, 'get', '/notes', headers={'If-None-Match': asgi_etag})
+    assert asgi[0] == 304
+
+    # A write through either server changes the ETags of both.
+    asgi_client.post('/notes?api_key=key', json={'title': 'Po', 'text': 'zapisie'})
+    assert flask_client.get('/notes?api_key=key', headers={'If-None-Match': flask_etag}).status_code == 200
+    assert asgi_client.get('/notes?api_key=key', headers={'If-None-Match': asgi_etag}).status_code == 200
+
+
+def test_rate_limit_is_shared(clients):
+    flask_client, asgi_client = clients
+    assert flask_client.get('/notes/1?api_key=slow').status_code == 404
+    assert asgi_client.get('/notes/1?api_key=slow').status_code == 404
+    flask = flask_client.get('/notes/1?api_key=slow')
+    asgi = asgi_client.get('/notes/1?api_key=slow')
+    assert (flask.status_code, flask.json) == (asgi.status_code, asgi.json()) == \
+        (429, {'message': 'Rate limit exceeded'})
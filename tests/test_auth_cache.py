@@ -0,0 +1,46 @@
+from auth_cache import ApiKeyCache, ApiUser
+
+
+def test_cache_hit_skips_loader():
+    calls = []
+
+    def loader(api_key):
+        calls.append(api_key)
+        return ApiUser(1, 'user@example.com')
+
+    cache = ApiKeyCache()
+    assert cache.get('key', loader) == ApiUser(1, 'user@example.com')
+    assert cache.get('key', loader) == ApiUser(1, 'user@example.com')
+    assert calls == ['key']
+
+
+def test_unknown_key_is_negative_cached():
+    calls = []
+
+    def loader(api_key):
+        calls.append(api_key)
+        return None
+
+    cache = ApiKeyCache()
+    assert cache.get('missing', loader) is None
+    assert cache.get('missing', loader) is None
+    assert calls == ['missing']
+
+
+def test_invalidate_and_lru_eviction():
+    cache = ApiKeyCache(maxsize=2)
+    cache.get('a', lambda key: ApiUser(1, 'a'))
+    cache.get('b', lambda key: ApiUser(2, 'b'))
+    cache.get('a', lambda key: None)
+    cache.get('c', lambda key: ApiUser(3, 'c'))
+    assert cache.get('a', lambda key: None) == ApiUser(1, 'a')
+    assert cache.get('b', lambda key: None) is None
+    cache.invalidate('a')
+    assert cache.get('a', lambda key: None) is None
+
+
+def test_entries_expire_after_ttl():
+    cache = ApiKeyCache(ttl=0)
+    cache.get('a', lambda key: ApiUser(1, 'a'))
+    # A key regenerated by another worker is looked up again once the entry expires.
+    assert cache.get('a', lambda key: None) is None
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import Column, Integer, String, Text, text
+from sqlalchemy.orm import Session, declarative_base
+
+from batch import apply_note_batch
+
+Base = declarative_base()
+
+
+class Note(Base):
+    __tablename__ = 'note'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    title = Column(String(255), nullable=False)
+    text = Column(Text, nullable=False)
+
+
+@pytest.fixture
+def session(database):
+    app, db = database([
+        "CREATE TABLE note (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, title VARCHAR(255) NOT NULL, "
+        "text TEXT NOT NULL)",
+        "INSERT INTO note VALUES (1, 1, 'Zakupy', 'mleko'), (2, 2, 'Praca', 'raport')",
+    ])
+    with app.app_context(), Session(db.engine) as session:
+        yield session
+
+
+def test_operations_are_applied_in_order(session):
+    results = apply_note_batch(session, Note, 1, [
+        {'op': 'create', 'title': 'Nowa', 'text': 'treść'},
+        {'op': 'update', 'id': 1, 'title': 'Zakupy', 'text': 'chleb'},
+        {'op': 'delete', 'id': 2},
+        {'op': 'create', 'title': 'Druga', 'text': 'treść'},
+    ])
+    session.commit()
+    assert [result['status'] for result in results] == [201, 200, 404, 201]
+    assert session.get(Note, 1).text == 'chleb'
+    assert session.get(Note, 2) is not None
+    assert [session.get(Note, results[index]['id']).title for index in (0, 3)] == ['Nowa', 'Druga']
+
+
+@pytest.mark.parametrize('note_id', [[1], {'id': 1}, '1', 1.0, True, None])
+def test_invalid_ids_fail_only_their_operation(session, note_id):
+    results = apply_note_batch(session, Note, 1, [
+        {'op': 'delete', 'id': note_id},
+        {'op': 'update', 'id': 1, 'title': 'Zakupy', 'text': 'chleb'},
+    ])
+    assert results[0] == {'op': 'delete', 'id': None, 'status': 400, 'message': 'Id must be an integer'}
+    assert results[1]['status'] == 200
+
+
+@pytest.mark.parametrize('payload', [[], [{'op': 'delete', 'id': 1}], {'operations': {'op': 'delete'}}])
+def test_batch_body_must_hold_a_list_of_operations(paw_app, payload):
+    app = paw_app()
+    with app.app_context():
+        app.extensions['sqlalchemy'].session.execute(
+            text("INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'a@example.com', 'key')"))
+        app.extensions['sqlalchemy'].session.commit()
+    response = app.test_client().post('/notes/batch?api_key=key', json=payload)
+    assert response.status_code == 400
+    assert response.json == {'message': 'Operations must be a list'}
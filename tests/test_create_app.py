@@ -0,0 +1,37 @@
+from sqlalchemy import text
+
+import app as module
+
+
+def add_user(app, api_key):
+    with app.app_context():
+        module.db.session.execute(text("INSERT INTO user_info (user_id, email, api_key, total_requests) "
+                                       "VALUES (1, 'a@example.com', :api_key, 0)"), {'api_key': api_key})
+        module.db.session.commit()
+
+
+def total_requests(app):
+    with app.app_context():
+        return module.db.session.get(module.User, 1).total_requests
+
+
+def test_apps_in_one_process_keep_their_own_state(paw_app):
+    first = paw_app('first', USAGE_FLUSH_INTERVAL=0, RATE_LIMIT_BURST=1)
+    second = paw_app('second', USAGE_FLUSH_INTERVAL=0)
+    add_user(first, 'first-key')
+    add_user(second, 'second-key')
+
+    assert first.test_client().get('/notes?api_key=first-key').status_code == 200
+    assert first.test_client().get('/notes?api_key=first-key').status_code == 429
+    assert second.test_client().get('/notes?api_key=second-key').status_code == 200
+    first.extensions['paw']['usage_counter'].flush()
+    second.extensions['paw']['usage_counter'].flush()
+    assert total_requests(first) == 2
+    assert total_requests(second) == 1
+
+    with first.app_context():
+        job_id = module.jobs.enqueue('unknown_task')
+    assert first.extensions['paw']['jobs'].run_pending() == 1
+    assert second.extensions['paw']['jobs'].status(job_id) is None
+    with first.app_context():
+        assert module.jobs.status(job_id)['status'] == 'failed'
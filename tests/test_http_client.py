@@ -0,0 +1,70 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import HttpClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    failures = 0
+
+    def do_GET(self):
+        if self.path.startswith('/flaky') and StubHandler.failures > 0:
+            StubHandler.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/slow'):
+            threading.Event().wait(0.5)
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_records_latency_per_endpoint(stub_url):
+    http = HttpClient()
+    assert http.get(f'{stub_url}/images/profile_pic_1.jpg').text == 'ok'
+    assert http.get(f'{stub_url}/images/profile_pic_2.jpg').text == 'ok'
+
+    metrics = http.metrics()
+    endpoint = metrics['endpoints'][f"GET {stub_url[len('http://'):]}/images/profile_pic_:id.jpg"]
+    assert endpoint['count'] == 2
+    assert endpoint['errors'] == 0
+    assert metrics['in_flight'] == 0
+
+
+def test_retries_with_backoff(stub_url):
+    StubHandler.failures = 2
+    http = HttpClient(retries=2, backoff=0)
+    assert http.get(f'{stub_url}/flaky').status_code == 200
+
+
+def test_read_timeout(stub_url):
+    http = HttpClient(read_timeout=0.1, retries=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http.get(f'{stub_url}/slow')
+    assert list(http.metrics()['endpoints'].values())[0]['errors'] == 1
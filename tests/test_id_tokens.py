@@ -0,0 +1,157 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from sqlalchemy import text
+
+from firebase_client import LocalAuth
+from id_tokens import IdTokenVerifier, InvalidIdToken, SigningKeyCache, SigningKeysUnavailable, VerifiedAccountCache
+
+
+class FakeResponse:
+
+    def __init__(self, keys, max_age):
+        self.keys = keys
+        self.headers = {'Cache-Control': f"public, max-age={max_age}, must-revalidate"}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {kid: key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+                .decode() for kid, key in self.keys.items()}
+
+
+class FakeHttp:
+    """Serves the public keys of ``auth`` the way Google serves its securetoken certificates."""
+
+    def __init__(self, auth, max_age=3600):
+        self.auth = auth
+        self.max_age = max_age
+        self.fetches = 0
+
+    def get(self, url):
+        self.fetches += 1
+        return FakeResponse(self.auth.signing_keys, self.max_age)
+
+
+class FailingHttp:
+
+    def __init__(self):
+        self.fetches = 0
+
+    def get(self, url):
+        self.fetches += 1
+        raise ConnectionError('certificates unavailable')
+
+
+def rotated_auth():
+    """Same project and account, signed with a new key."""
+    auth = LocalAuth('paw-test')
+    auth.add_account('verified@example.com', 'secret')
+    return auth
+
+
+@pytest.fixture(scope='module')
+def auth():
+    auth = LocalAuth('paw-test')
+    auth.add_account('verified@example.com', 'secret')
+    auth.add_account('new@example.com', 'secret', verified=False)
+    return auth
+
+
+@pytest.fixture
+def verifier(auth):
+    keys = SigningKeyCache()
+    keys.set_keys(auth.signing_keys)
+    return IdTokenVerifier(keys, 'paw-test')
+
+
+def test_verify_token(auth, verifier):
+    user = auth.sign_in_with_email_and_password('verified@example.com', 'secret')
+    claims = verifier.verify(user['idToken'])
+    assert claims['sub'] == user['localId']
+    assert claims['email_verified'] is True
+
+
+def test_reject_invalid_tokens(auth, verifier):
+    token = auth.id_token('verified@example.com')
+    header, payload, signature = token.split('.')
+    with pytest.raises(InvalidIdToken, match='signature'):
+        verifier.verify(f"{header}.{auth.id_token('new@example.com').split('.')[1]}.{signature}")
+    with pytest.raises(InvalidIdToken, match='expired'):
+        verifier.verify(auth.id_token('verified@example.com', issued_at=time.time() - 7200))
+    with pytest.raises(InvalidIdToken, match='Malformed'):
+        verifier.verify('not-a-token')
+    with pytest.raises(InvalidIdToken, match='audience'):
+        IdTokenVerifier(verifier.keys, 'other-project').verify(token)
+    with pytest.raises(InvalidIdToken, match='Unknown signing key'):
+        verifier.verify(rotated_auth().id_token('verified@example.com'))
+
+
+def test_keys_refresh_on_expiry_and_rotation(auth):
+    http = FakeHttp(auth, max_age=0)
+    keys = SigningKeyCache(http, min_refresh=3600)
+    verifier = IdTokenVerifier(keys, 'paw-test')
+    verifier.verify(auth.id_token('verified@example.com'))
+    verifier.verify(auth.id_token('verified@example.com'))
+    assert http.fetches == 2
+
+    http = FakeHttp(auth)
+    keys = SigningKeyCache(http, min_refresh=0)
+    verifier = IdTokenVerifier(keys, 'paw-test')
+    verifier.verify(auth.id_token('verified@example.com'))
+    verifier.verify(auth.id_token('verified@example.com'))
+    assert http.fetches == 1
+
+    rotated = rotated_auth()
+    http.auth = rotated
+    verifier.verify(rotated.id_token('verified@example.com'))
+    assert http.fetches == 2
+
+
+def test_old_keys_outlive_a_failed_refresh(auth):
+    http = FakeHttp(auth, max_age=0)
+    verifier = IdTokenVerifier(SigningKeyCache(http, min_refresh=0), 'paw-test')
+    verifier.verify(auth.id_token('verified@example.com'))
+    verifier.keys.http = FailingHttp()
+    assert verifier.verify(auth.id_token('verified@example.com'))['email'] == 'verified@example.com'
+    assert verifier.keys.http.fetches == 1
+
+
+def test_no_keys_is_not_an_invalid_token(auth):
+    http = FailingHttp()
+    verifier = IdTokenVerifier(SigningKeyCache(http), 'paw-test')
+    for _ in range(2):
+        with pytest.raises(SigningKeysUnavailable):
+            verifier.verify(auth.id_token('verified@example.com'))
+    assert http.fetches == 1
+
+
+def test_login_falls_back_to_firebase_without_keys(auth, paw_app):
+    app = paw_app(FIREBASE_AUTH=auth, FIREBASE_CONFIG={'projectId': 'paw-test', 'storageBucket': None})
+    app.extensions['paw']['id_tokens'].keys.http = FailingHttp()
+    with app.app_context():
+        app.extensions['sqlalchemy'].session.execute(text(
+            "INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'verified@example.com', 'key')"))
+        app.extensions['sqlalchemy'].session.commit()
+    client = app.test_client()
+    client.post('/', data={'email': 'verified@example.com', 'password': 'secret'})
+    with client.session_transaction() as session:
+        assert session['user'] == 'verified@example.com'
+        assert session['idTokenExpires'] > time.time()
+
+
+def test_verified_account_is_remembered():
+    cache = VerifiedAccountCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return True
+
+    assert not cache.email_verified('uid-1', {'email_verified': False}, loader)
+    assert cache.email_verified('uid-1', {}, loader)
+    assert cache.email_verified('uid-1', {}, loader)
+    assert cache.email_verified('uid-2', {'email_verified': True}, loader)
+    assert len(calls) == 1
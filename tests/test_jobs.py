@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from jobs import JOB_SCHEMA, JobQueue, PermanentJobError
+
+
+@pytest.fixture
+def queue(database):
+    app, db = database(JOB_SCHEMA)
+    queue = JobQueue(db, workers=0, backoff=0)
+    queue.init_app(app)
+    return queue
+
+
+def test_retries_until_success(queue):
+    calls = []
+
+    @queue.task('flaky')
+    def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise ConnectionError('timeout')
+
+    job_id = queue.enqueue('flaky', {'value': 1})
+    assert queue.status(job_id)['status'] == 'queued'
+    assert queue.run_pending() == 3
+    status = queue.status(job_id)
+    assert status['status'] == 'done'
+    assert status['attempts'] == 3
+    assert calls == [1, 1, 1]
+
+
+def test_permanent_errors_and_exhausted_retries_fail(queue):
+    queue.max_attempts = 2
+
+    @queue.task('missing')
+    def missing():
+        raise PermanentJobError('EMAIL_NOT_FOUND')
+
+    @queue.task('down')
+    def down():
+        raise ConnectionError('timeout')
+
+    missing_id = queue.enqueue('missing')
+    down_id = queue.enqueue('down')
+    queue.run_pending()
+    assert queue.status(missing_id)['attempts'] == 1
+    assert queue.status(missing_id)['status'] == 'failed'
+    assert queue.status(down_id)['attempts'] == 2
+    assert 'timeout' in queue.status(down_id)['last_error']
+
+
+def test_idempotency_key(queue):
+    calls = []
+    queue.task('send')(lambda email: calls.append(email))
+
+    first = queue.enqueue('send', {'email': 'user@example.com'}, key='reset:user@example.com')
+    second = queue.enqueue('send', {'email': 'user@example.com'}, key='reset:user@example.com')
+    assert first == second
+    assert queue.status(key='reset:user@example.com')['id'] == first
+    queue.run_pending()
+    assert calls == ['user@example.com']
+
+
+def test_drain_runs_queued_jobs(queue):
+    calls = []
+    queue.task('send')(lambda number: calls.append(number))
+    queue.workers = 2
+    for number in range(10):
+        queue.enqueue('send', {'number': number})
+    queue.drain(timeout=5)
+    assert sorted(calls) == list(range(10))
+
+
+def test_jobs_left_by_an_earlier_process_resume_on_startup(database, queue):
+    job_id = queue.enqueue('send', {'number': 1})
+    app, db = database([])
+
+    restarted = JobQueue(db, workers=1, poll_interval=0.01)
+    done = threading.Event()
+    restarted.task('send')(lambda number: done.set())
+    restarted.init_app(app)
+    assert done.wait(5)
+    restarted.drain(timeout=5)
+    assert restarted.status(job_id)['status'] == 'done'
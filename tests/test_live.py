@@ -0,0 +1,72 @@
+import live
+from live import UsageBroadcaster
+
+
+class FakeSocketIO:
+
+    def __init__(self):
+        self.emitted = []
+        self.tasks = []
+        self.on_sleep = None
+
+    def start_background_task(self, target):
+        self.tasks.append(target)
+        return target
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((to, data['value']))
+
+    def sleep(self, seconds):
+        if self.on_sleep:
+            self.on_sleep()
+
+
+def test_rooms_only_get_their_own_rate():
+    socketio = FakeSocketIO()
+    broadcaster = UsageBroadcaster(socketio, window=10)
+    broadcaster.connect('a', 1)
+    broadcaster.connect('b', 2)
+    broadcaster.connect('c', 3)
+    for _ in range(5):
+        broadcaster.increment(1)
+    broadcaster.increment(2, count=20)
+    broadcaster.increment(4)
+    assert broadcaster.broadcast()
+    assert sorted(socketio.emitted) == [('user_1', 0.5), ('user_2', 2.0)]
+
+
+def test_rooms_without_traffic_get_nothing(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(live.time, 'monotonic', lambda: now[0])
+    socketio = FakeSocketIO()
+    broadcaster = UsageBroadcaster(socketio, window=10)
+    broadcaster.connect('a', 1)
+    broadcaster.connect('b', 2)
+    broadcaster.increment(1)
+    assert broadcaster.broadcast()
+    assert socketio.emitted == [('user_1', 0.1)]
+
+    # Once the traffic leaves the window the room gets a last zero, then nothing.
+    now[0] += 10
+    socketio.emitted.clear()
+    broadcaster.broadcast()
+    broadcaster.broadcast()
+    assert socketio.emitted == [('user_1', 0.0)]
+
+
+def test_task_ends_with_the_last_socket():
+    socketio = FakeSocketIO()
+    broadcaster = UsageBroadcaster(socketio)
+    broadcaster.connect('a', 1)
+    broadcaster.connect('b', 1)
+    assert len(socketio.tasks) == 1
+
+    sockets = ['a', 'b']
+    socketio.on_sleep = lambda: broadcaster.disconnect(sockets.pop())
+    socketio.tasks[0]()
+    assert sockets == []
+    broadcaster.increment(1)
+    assert not broadcaster.broadcast()
+
+    broadcaster.connect('c', 1)
+    assert len(socketio.tasks) == 2
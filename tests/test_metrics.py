@@ -0,0 +1,48 @@
+from flask import Flask, request
+from sqlalchemy import create_engine, text
+
+from metrics import Metrics, RequestProfiler
+
+
+def create_app():
+    app = Flask(__name__)
+    engine = create_engine('sqlite://')
+    metrics = Metrics()
+    metrics.init_app(app, engine)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            connection.execute(text('SELECT 2'))
+        return {'id': item_id}
+
+    return app
+
+
+def test_requests_are_labelled_by_route():
+    client = create_app().test_client()
+    client.get('/items/1')
+    client.get('/items/2')
+    client.get('/missing')
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'paw_requests_total{method="GET",route="/items/<int:item_id>",status="200"} 2' in body
+    assert 'paw_requests_total{method="GET",route="<unmatched>",status="404"} 1' in body
+    assert 'paw_request_duration_seconds_count{method="GET",route="/items/<int:item_id>"} 2' in body
+    assert 'paw_request_sql_queries_bucket{route="/items/<int:item_id>",le="1"} 0' in body
+    assert 'paw_request_sql_queries_bucket{route="/items/<int:item_id>",le="2"} 2' in body
+    assert 'paw_sql_query_duration_seconds_count 4' in body
+
+
+def test_profile_only_for_admins():
+    app = create_app()
+    RequestProfiler(lambda: request.args.get('user') == 'admin').init_app(app)
+    client = app.test_client()
+
+    response = client.get('/items/1?profile=1&user=admin')
+    assert response.mimetype == 'text/plain'
+    assert 'function calls' in response.get_data(as_text=True)
+
+    response = client.get('/items/1?profile=1&user=guest')
+    assert response.get_json() == {'id': 1}
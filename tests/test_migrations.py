@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from migrations import MIGRATIONS, check_version, current_version, database_path, upgrade
+
+LATEST = MIGRATIONS[-1][0]
+
+HOT_QUERIES = {
+    'notes of a user': ("SELECT id, title, text, date_added FROM note WHERE user_id = ? "
+                        "ORDER BY date_added, id LIMIT 100", (1,)),
+    'next page of notes': ("SELECT id, title FROM note WHERE user_id = ? AND (date_added > ? OR "
+                           "(date_added = ? AND id > ?)) ORDER BY date_added, id LIMIT 100",
+                           (1, '2023-01-01', '2023-01-01', 1)),
+    'one note of a user': ("SELECT * FROM note WHERE user_id = ? AND id = ?", (1, 1)),
+    'user by api key': ("SELECT * FROM user_info WHERE api_key = ?", ('key',)),
+    'user by email': ("SELECT * FROM user_info WHERE email = ?", ('user@example.com',)),
+    'changed notes of a user': ("SELECT * FROM note WHERE user_id = ? AND revision > ? ORDER BY revision LIMIT 100",
+                                (1, 10)),
+    'deleted notes of a user': ("SELECT * FROM note_tombstone WHERE user_id = ? AND revision > ? "
+                                "ORDER BY revision LIMIT 100", (1, 10)),
+}
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'paw.db')
+    yield connection
+    connection.close()
+
+
+def test_upgrade_existing_database(connection):
+    # Schema created by db_init.py before migrations existed.
+    connection.execute('''CREATE TABLE user_info
+                          (user_id INTEGER PRIMARY KEY, email TEXT UNIQUE, api_key VARCHAR(16),
+                           total_requests INTEGER, last_request_timestamp datetime)''')
+    connection.execute('''CREATE TABLE note
+                          (id INTEGER PRIMARY KEY, user_id INTEGER, title TEXT, text TEXT, date_added datetime,
+                           FOREIGN KEY (user_id) REFERENCES user_info(user_id))''')
+    connection.execute("INSERT INTO user_info VALUES (1, 'user@example.com', 'key', 0, '2023-06-27')")
+    connection.execute("INSERT INTO note VALUES (1, 1, 'Zakupy', 'mleko', '2023-01-01')")
+    connection.commit()
+
+    assert [version for version, _ in upgrade(connection)] == [number for number, _, _ in MIGRATIONS]
+    assert current_version(connection) == LATEST
+    assert connection.execute("SELECT rowid FROM note_fts WHERE note_fts MATCH 'mleko'").fetchall() == [(1,)]
+    assert upgrade(connection) == []
+
+
+def test_unique_api_key(connection):
+    upgrade(connection)
+    connection.execute("INSERT INTO user_info (email, api_key) VALUES ('a@example.com', 'key')")
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.execute("INSERT INTO user_info (email, api_key) VALUES ('b@example.com', 'key')")
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_queries_use_an_index(connection, name):
+    upgrade(connection)
+    query, parameters = HOT_QUERIES[name]
+    plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", parameters)]
+    assert plan, name
+    for step in plan:
+        assert step.startswith('SEARCH'), f"{name}: {step}"
+        assert 'TEMP B-TREE' not in step, f"{name}: {step}"
+
+
+def test_changes_are_numbered_per_user(connection):
+    upgrade(connection, target=4)
+    connection.execute("INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'a@example.com', 'a')")
+    connection.execute("INSERT INTO user_info (user_id, email, api_key) VALUES (2, 'b@example.com', 'b')")
+    connection.execute("INSERT INTO note (user_id, title, text) VALUES (1, 'Stara', 'sprzed migracji')")
+    connection.commit()
+    upgrade(connection)
+    connection.execute("INSERT INTO note (user_id, title, text) VALUES (1, 'Zakupy', 'mleko')")
+    connection.execute("INSERT INTO note (user_id, title, text) VALUES (2, 'Praca', 'raport')")
+    connection.execute("UPDATE note SET text = 'chleb' WHERE id = 1")
+    connection.execute("DELETE FROM note WHERE id = 2")
+
+    assert connection.execute("SELECT id, revision FROM note ORDER BY id").fetchall() == [(1, 3), (3, 1)]
+    assert connection.execute("SELECT note_id, revision FROM note_tombstone").fetchall() == [(2, 4)]
+    assert connection.execute("SELECT change_seq FROM user_info ORDER BY user_id").fetchall() == [(4,), (1,)]
+
+
+def test_outdated_schema_is_refused(connection):
+    upgrade(connection, target=LATEST - 1)
+    with pytest.raises(RuntimeError, match='migrate.py'):
+        check_version(connection)
+    upgrade(connection)
+    check_version(connection)
+
+
+def test_database_path_is_relative_to_the_instance_folder():
+    assert database_path('sqlite:///paw.db', '/srv/paw/instance') == '/srv/paw/instance/paw.db'
+    assert database_path('sqlite:////var/lib/paw.db', '/srv/paw/instance') == '/var/lib/paw.db'
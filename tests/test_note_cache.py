@@ -0,0 +1,18 @@
+from note_cache import NoteListCache
+
+
+def test_fragments_follow_the_version():
+    cache = NoteListCache()
+    assert cache.fragment(1, 3, lambda: 'v3') == 'v3'
+    assert cache.fragment(1, 3, lambda: 'again') == 'v3'
+    assert cache.fragment(1, 4, lambda: 'v4') == 'v4'
+    # A render that started before the write finished must not replace the newer one.
+    assert cache.fragment(1, 3, lambda: 'late') == 'late'
+    assert cache.fragment(1, 4, lambda: 'again') == 'v4'
+
+
+def test_etag_changes_with_version_and_parts():
+    cache = NoteListCache()
+    assert cache.etag(1, 3, 'a') == cache.etag(1, 3, 'a')
+    assert len({cache.etag(1, 3, 'a'), cache.etag(1, 4, 'a'), cache.etag(1, 3, 'b'), cache.etag(2, 3, 'a')}) == 4
+    assert cache.etag(1, 3, 'a') != NoteListCache().etag(1, 3, 'a')
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+
+from pagination import decode_cursor, encode_cursor, keyset_page
+
+note = Table('note', MetaData(), Column('id', Integer, primary_key=True), Column('date_added', DateTime))
+
+
+@pytest.fixture
+def notes(database):
+    app, db = database([
+        "CREATE TABLE note (id INTEGER PRIMARY KEY, date_added DATETIME)",
+        # Dates as db_init.py seeds them, as SQLAlchemy writes them and missing.
+        "INSERT INTO note VALUES (1, '2023-01-01'), (2, '2023-02-27'), (3, '2023-02-27'), "
+        "(4, '2023-03-27 10:00:00.000000'), (5, NULL), (6, NULL)",
+    ])
+    with app.app_context():
+        yield db.session.query(note.c.id, note.c.date_added)
+
+
+def pages(query, limit):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(query, note.c.date_added, note.c.id,
+                                   decode_cursor(cursor) if cursor else None, limit)
+        ids.append([row.id for row in rows])
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_every_date_format(notes):
+    assert pages(notes, 1) == [[5], [6], [1], [2], [3], [4]]
+    assert pages(notes, 4) == [[5, 6, 1, 2], [3, 4]]
+
+
+def test_invalid_cursors_are_rejected():
+    assert decode_cursor(encode_cursor('2023-01-01', 1)) == ('2023-01-01', 1)
+    assert decode_cursor(encode_cursor(None, 5)) == (None, 5)
+    for cursor in ('not a cursor', encode_cursor('2023-01-01', '1'), encode_cursor(1, 1)):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
@@ -0,0 +1,198 @@
+import io
+import os
+import time
+
+import pytest
+from flask import Flask
+from PIL import Image
+from sqlalchemy import text
+
+from avatar_cache import AvatarCache
+from profile_pics import UPLOAD_SCHEMA, LocalStorageBackend, ProfilePicCache, ProfilePicUploader, profile_pic_name
+
+PICTURE = os.path.join(os.path.dirname(__file__), 'instance', 'test.jpg')
+
+
+class CountingBackend(LocalStorageBackend):
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.stat_calls = 0
+
+    def stat(self, name):
+        self.stat_calls += 1
+        return super().stat(name)
+
+
+def test_missing_picture_is_cached(tmp_path):
+    backend = CountingBackend(str(tmp_path))
+    cache = ProfilePicCache(backend)
+    assert not cache.exists(1)
+    assert not cache.exists(1)
+    assert backend.stat_calls == 1
+
+
+def test_upload_updates_cache(tmp_path):
+    backend = CountingBackend(str(tmp_path / 'storage'))
+    cache = ProfilePicCache(backend)
+    assert not cache.exists(1)
+
+    with open(PICTURE, 'rb') as picture:
+        info = cache.upload(1, picture)
+    assert info.exists
+    assert info.size == os.path.getsize(PICTURE)
+    assert cache.get(1) == info
+    assert backend.stat_calls == 2
+    assert os.path.exists(backend.path(profile_pic_name(1)))
+
+    target = tmp_path / 'downloaded.jpg'
+    cache.download(1, str(target))
+    assert target.read_bytes() == open(PICTURE, 'rb').read()
+
+
+def test_uploader_resizes_and_adds_thumbnail(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    uploader = ProfilePicUploader(ProfilePicCache(backend), max_size=100, thumb_size=16, workers=1)
+    uploader.init_app(Flask(__name__))
+
+    with open(PICTURE, 'rb') as picture:
+        uploader.submit(1, picture).result()
+
+    assert max(Image.open(backend.path(profile_pic_name(1))).size) == 100
+    assert max(Image.open(backend.path(profile_pic_name(1, 'thumb'))).size) == 16
+    assert uploader.pics.exists(1)
+
+
+def test_uploader_rejects_non_images(tmp_path):
+    uploader = ProfilePicUploader(ProfilePicCache(LocalStorageBackend(str(tmp_path))), workers=1)
+    uploader.init_app(Flask(__name__))
+    with pytest.raises(Exception):
+        uploader.submit(1, io.BytesIO(b'not an image'))
+
+
+def test_avatar_cache_is_content_addressed_and_bounded(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / 'storage'))
+    pics = ProfilePicCache(backend)
+    for user_id in (1, 2):
+        with open(PICTURE, 'rb') as picture:
+            pics.upload(user_id, picture)
+    cache = AvatarCache(pics, root=str(tmp_path / 'avatars'), max_bytes=os.path.getsize(PICTURE), grace=0)
+    os.makedirs(cache.root)
+
+    path, digest = cache.get(1)
+    assert cache.get(2) == (path, digest)
+    assert os.listdir(cache.root) == [f"{digest}.jpg"]
+    assert cache.get(3) is None
+
+    with open(PICTURE, 'rb') as picture:
+        pics.upload(2, io.BytesIO(picture.read() + b'\0'))
+    other_path, other_digest = cache.get(2)
+    assert other_digest != digest
+    assert os.listdir(cache.root) == [f"{other_digest}.jpg"]
+
+
+def test_recently_served_avatars_are_not_evicted(tmp_path):
+    pics = ProfilePicCache(LocalStorageBackend(str(tmp_path / 'storage')))
+    for user_id in (1, 2, 3):
+        with open(PICTURE, 'rb') as picture:
+            pics.upload(user_id, io.BytesIO(picture.read() + bytes([user_id])))
+    cache = AvatarCache(pics, root=str(tmp_path / 'avatars'), max_bytes=os.path.getsize(PICTURE))
+    os.makedirs(cache.root)
+
+    path, _ = cache.get(1)
+    cache.get(2)
+    assert os.path.exists(path)
+    cache.grace = 0
+    cache.get(3)
+    assert not os.path.exists(path)
+
+
+def test_missing_variant_is_cached(tmp_path):
+    downloads = []
+
+    class RecordingBackend(LocalStorageBackend):
+        def download(self, name, filename):
+            downloads.append(name)
+            super().download(name, filename)
+
+    pics = ProfilePicCache(RecordingBackend(str(tmp_path / 'storage')))
+    with open(PICTURE, 'rb') as picture:
+        pics.upload(1, picture)
+    cache = AvatarCache(pics, root=str(tmp_path / 'avatars'))
+    os.makedirs(cache.root)
+
+    assert cache.get(1, 'thumb') is None
+    assert cache.get(1, 'thumb') is None
+    assert downloads == [profile_pic_name(1, 'thumb')]
+
+    with open(PICTURE, 'rb') as picture:
+        pics.upload(1, picture, variant='thumb')
+    with open(PICTURE, 'rb') as picture:
+        pics.upload(1, io.BytesIO(picture.read() + b'\0'))
+    assert cache.get(1, 'thumb') is not None
+
+
+def test_uploader_writes_the_full_size_picture_last(tmp_path):
+    uploads = []
+
+    class RecordingBackend(LocalStorageBackend):
+        def upload(self, name, stream, token=None):
+            uploads.append(name)
+            return super().upload(name, stream, token)
+
+    uploader = ProfilePicUploader(ProfilePicCache(RecordingBackend(str(tmp_path))), workers=1)
+    uploader.init_app(Flask(__name__))
+    with open(PICTURE, 'rb') as picture:
+        uploader.submit(1, picture).result()
+    assert uploads == [profile_pic_name(1, 'thumb'), profile_pic_name(1)]
+
+
+def test_upload_results_are_recorded(tmp_path, database):
+    app, db = database(UPLOAD_SCHEMA)
+
+    class FailingBackend(LocalStorageBackend):
+        def upload(self, name, stream, token=None):
+            if name == profile_pic_name(2, 'thumb'):
+                raise ConnectionError('storage is down')
+            return super().upload(name, stream, token)
+
+    uploader = ProfilePicUploader(ProfilePicCache(FailingBackend(str(tmp_path / 'storage'))), db, workers=1)
+    uploader.init_app(app)
+    assert uploader.result(1) is None
+    for user_id in (1, 2):
+        with open(PICTURE, 'rb') as picture:
+            future = uploader.submit(user_id, picture)
+        future.exception()
+
+    assert uploader.result(1) == ('done', None)
+    status, error = uploader.result(2)
+    assert status == 'failed'
+    assert 'storage is down' in error
+    assert uploader.result(1) is None
+    assert uploader.result(2) is None
+
+
+def test_settings_report_a_failed_upload(tmp_path, paw_app):
+    storage = tmp_path / 'storage'
+    storage.write_bytes(b'')  # a file where the storage directory should be, so every upload fails
+    app = paw_app(PROFILE_PIC_LOCAL_ROOT=str(storage))
+    with app.app_context():
+        app.extensions['sqlalchemy'].session.execute(
+            text("INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'a@example.com', 'key')"))
+        app.extensions['sqlalchemy'].session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update({'user': 'a@example.com', 'uid': 1, 'user_id': None, 'idToken': 'token',
+                        'idTokenExpires': time.time() + 3600})
+
+    with open(PICTURE, 'rb') as picture:
+        response = client.post('/settings', data={'profile_pic': (picture, 'test.jpg')})
+    assert 'Zdjęcie jest wysyłane' in response.get_data(as_text=True)
+    uploader = app.extensions['paw']['profile_pic_uploader']
+    uploader._executor.shutdown(wait=True)
+
+    response = client.get('/settings')
+    assert 'Nie udało się wysłać zdjęcia' in response.get_data(as_text=True)
+    with client.session_transaction() as session:
+        assert 'pic_upload' not in session
+        assert session['user_id'] is None
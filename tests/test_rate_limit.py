@@ -0,0 +1,53 @@
+from rate_limit import MemoryBucketStore, RateLimiter
+
+
+def test_burst_then_refill():
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.hit('key', now=100).allowed for _ in range(4)] == [True, True, True, False]
+
+    denied = limiter.hit('key', now=100)
+    assert denied.remaining == 0
+    assert denied.retry_after == 1
+    assert limiter.headers(denied)['Retry-After'] == '1'
+
+    assert limiter.hit('key', now=100.5).allowed
+    assert not limiter.hit('key', now=100.5).allowed
+    assert limiter.hit('key', now=110).remaining == 2
+
+
+def test_per_key_and_per_user_limits():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.hit('a', now=0).allowed
+    assert not limiter.hit('a', now=0).allowed
+    assert limiter.hit('b', now=0).allowed
+
+    premium = [limiter.hit('c', rate=100, burst=50, now=0) for _ in range(50)]
+    assert all(limit.allowed for limit in premium)
+    assert premium[-1].limit == 50
+    assert 'Retry-After' not in limiter.headers(premium[-1])
+
+
+def test_store_is_bounded():
+    store = MemoryBucketStore(maxsize=2)
+    limiter = RateLimiter(store, rate=1, burst=1)
+    for key in ('a', 'b', 'c'):
+        limiter.hit(key, now=0)
+    assert len(store._buckets) == 2
+    assert limiter.hit('a', now=0).allowed
+
+
+def test_failing_store_lets_requests_through():
+    class BrokenStore:
+        def take(self, key, rate, burst, now):
+            raise ConnectionError('store is down')
+
+    assert RateLimiter(BrokenStore()).hit('key') is None
+
+
+def test_zero_rate_blocks_the_key():
+    limiter = RateLimiter(rate=1, burst=1)
+    blocked = limiter.hit('a', rate=0, now=0)
+    assert not blocked.allowed
+    assert 'Retry-After' not in limiter.headers(blocked)
+    assert not limiter.hit('a', rate=1, burst=0, now=0).allowed
+    assert limiter.hit('a', rate=None, burst=None, now=0).allowed
@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+from app import db
+from search import build_match_query, highlight
+
+
+def test_words_are_quoted():
+    assert build_match_query('zebra* OR "fish"') == '"zebra" "OR" "fish"'
+
+
+def test_highlight_escapes_the_note_text():
+    assert highlight('<b>\x02zebra\x03</b> & \x02fish\x03') == \
+        '&lt;b&gt;<mark>zebra</mark>&lt;/b&gt; &amp; <mark>fish</mark>'
+
+
+def test_snippets_do_not_pass_html_through(paw_app):
+    app = paw_app()
+    with app.app_context():
+        db.session.execute(text("INSERT INTO user_info (user_id, email, api_key) VALUES (1, 'a@example.com', 'key')"))
+        db.session.execute(text("INSERT INTO note (user_id, title, text) "
+                                "VALUES (1, 'Zoo', '<img src=x onerror=alert(1)> zebra')"))
+        db.session.commit()
+    response = app.test_client().get('/notes/search?api_key=key&q=zebra&snippets=1')
+    assert response.status_code == 200
+    assert response.json['notes'][0]['snippet'] == '&lt;img src=x onerror=alert(1)&gt; <mark>zebra</mark>'
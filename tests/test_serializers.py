@@ -0,0 +1,53 @@
+import gzip
+
+import brotli
+import msgpack
+from flask import Flask
+from flask_restx import Api, Resource
+
+from serializers import Serializers
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['API_COMPRESS_MIN_SIZE'] = 100
+    api = Api(app)
+
+    @api.route('/notes/<int:count>')
+    class Notes(Resource):
+        def get(self, count):
+            return {'notes': [{'id': number, 'title': "Zażółć gęślą jaźń"} for number in range(count)]}, 200, \
+                {'ETag': '"v1"'}
+
+    Serializers().init_app(app, api)
+    return app
+
+
+def test_json_by_default_and_msgpack_on_request():
+    client = create_app().test_client()
+
+    response = client.get('/notes/1')
+    assert response.mimetype == 'application/json'
+    assert response.json == {'notes': [{'id': 0, 'title': "Zażółć gęślą jaźń"}]}
+
+    response = client.get('/notes/1', headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.data) == {'notes': [{'id': 0, 'title': "Zażółć gęślą jaźń"}]}
+
+
+def test_large_responses_are_compressed():
+    client = create_app().test_client()
+
+    response = client.get('/notes/1', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"v1"'
+
+    response = client.get('/notes/50', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.headers['ETag'] == 'W/"v1"'
+    assert len(brotli.decompress(response.data).decode().split('"id"')) == 51
+
+    response = client.get('/notes/50', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'"id":49' in gzip.decompress(response.data)
+    assert 'Accept-Encoding' in response.headers['Vary']
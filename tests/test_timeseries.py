@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from timeseries import SERIES_SCHEMA, UsageSeries
+
+DAY = 86400
+NOW = int(time.time()) // DAY * DAY - 12 * 3600  # noon yesterday, within the retention of every table
+
+
+@pytest.fixture
+def series(database):
+    app, db = database(SERIES_SCHEMA)
+    series = UsageSeries(db, slots=5, flush_interval=0)
+    series.init_app(app)
+    return series
+
+
+def test_counts_are_rolled_up(series):
+    for offset in (0, 10, 70):
+        series.record(1, now=NOW + offset)
+    series.record(2, count=5, now=NOW)
+    assert series.flush() == 3
+    series.record(1, now=NOW + 20)
+    series.flush()
+    series.record(1, now=NOW + 3600)
+    series.flush()
+
+    assert series.query(1, NOW, NOW + 180, 'minute') == [[NOW, 3], [NOW + 60, 1], [NOW + 120, 0]]
+    assert series.query(1, NOW, NOW + 7200, 'hour') == [[NOW, 4], [NOW + 3600, 1]]
+    assert series.query(1, NOW - DAY, NOW + 1, 'day') == [[NOW - 12 * 3600 - DAY, 0], [NOW - 12 * 3600, 5]]
+    assert series.query(2, NOW, NOW + 60, 'minute') == [[NOW, 5]]
+
+
+def test_ring_keeps_only_the_last_slots(series):
+    for minute in range(7):
+        series.record(1, now=NOW + minute * 60)
+    series.flush()
+    assert series.query(1, NOW, NOW + 7 * 60, 'minute') == [[NOW + minute * 60, int(minute >= 2)]
+                                                            for minute in range(7)]
+
+
+def test_resolution_follows_span_and_retention(series):
+    assert series.resolution(NOW - 3600, NOW, now=NOW) == 'minute'
+    assert series.resolution(NOW - 3 * DAY, NOW - 2.9 * DAY, now=NOW) == 'hour'
+    assert series.resolution(NOW - 30 * DAY, NOW, now=NOW) == 'hour'
+    assert series.resolution(NOW - 365 * DAY, NOW, now=NOW) == 'day'
+
+
+def test_query_includes_unflushed_counts(series):
+    series.record(1, now=NOW)
+    series.flush()
+    series.record(1, count=2, now=NOW + 60)
+    series.record(2, now=NOW + 60)
+    assert series.query(1, NOW, NOW + 120, 'minute') == [[NOW, 1], [NOW + 60, 2]]
+    assert series.query(1, NOW, NOW + 3600, 'hour') == [[NOW, 3]]
+    assert series.flush() == 2
+    assert series.query(1, NOW, NOW + 120, 'minute') == [[NOW, 1], [NOW + 60, 2]]
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.orm import declarative_base
+
+from usage import UsageCounter
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = 'user_info'
+    user_id = Column(Integer, primary_key=True)
+    api_key = Column(String(255))
+    total_requests = Column(Integer)
+    last_request_timestamp = Column(DateTime)
+
+
+USER_SCHEMA = [
+    "CREATE TABLE user_info (user_id INTEGER PRIMARY KEY, api_key VARCHAR(255), total_requests INTEGER, "
+    "last_request_timestamp DATETIME)",
+    "INSERT INTO user_info (user_id, api_key, total_requests) VALUES (1, 'a', 0), (2, 'b', NULL)",
+]
+
+
+def totals(counter):
+    with counter.app.app_context(), counter.db.engine.connect() as connection:
+        return dict(connection.exec_driver_sql("SELECT user_id, total_requests FROM user_info").all())
+
+
+@pytest.fixture
+def counter(database):
+    app, db = database(USER_SCHEMA)
+    counter = UsageCounter(db, User, flush_interval=0, flush_threshold=3)
+    counter.init_app(app)
+    return counter
+
+
+def test_full_buffer_is_flushed(counter):
+    counter.record(1)
+    counter.record(2)
+    assert totals(counter) == {1: 0, 2: None}
+    counter.record(1)
+    assert totals(counter) == {1: 2, 2: 1}
+    counter.record(1, flush=False)
+    counter.record(1, flush=False)
+    counter.record(1, flush=False)
+    assert totals(counter) == {1: 2, 2: 1}
+    assert counter.flush() == 1
+    assert totals(counter) == {1: 5, 2: 1}
+
+
+def test_failed_flush_keeps_the_counts(counter):
+    with counter.app.app_context(), counter.db.engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE user_info RENAME TO user_info_moved")
+    counter.record(1)
+    counter.record(2)
+    assert counter.flush() == 0
+    counter.record(1, flush=False)
+    with counter.app.app_context(), counter.db.engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE user_info_moved RENAME TO user_info")
+    assert counter.flush() == 2
+    assert totals(counter) == {1: 2, 2: 1}
+
+
+def test_counts_survive_a_key_rotation(counter):
+    counter.record(1)
+    with counter.app.app_context(), counter.db.engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE user_info SET api_key = 'rotated' WHERE user_id = 1")
+    assert counter.flush() == 1
+    assert totals(counter) == {1: 1, 2: None}
+
+
+def test_shutdown_stops_the_thread_and_flushes(counter):
+    counter.flush_interval = 60
+    counter.record(1)
+    thread = counter._thread
+    assert thread.is_alive()
+    counter.shutdown()
+    assert not thread.is_alive()
+    assert totals(counter) == {1: 1, 2: None}
@@ -0,0 +1,178 @@
+import atexit
+import threading
+import time
+from array import array
+
+from sqlalchemy import text
+
+# Bucket width in seconds of every rollup table (usage_minute, usage_hour, usage_day).
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+SERIES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS usage_{name}
+        (user_id INTEGER NOT NULL,
+         bucket INTEGER NOT NULL,
+         count INTEGER NOT NULL,
+         PRIMARY KEY (user_id, bucket)) WITHOUT ROWID"""
+    for name in RESOLUTIONS
+]
+
+
+class _Ring:
+    """Request counts of the last ``slots`` minutes of one user, in two fixed-size arrays."""
+
+    __slots__ = ('minutes', 'counts')
+
+    def __init__(self, slots):
+        self.minutes = array('q', [-1]) * slots
+        self.counts = array('Q', [0]) * slots
+
+
+class UsageSeries:
+    """Per-minute API request counts with hourly and daily rollups.
+
+    Requests are counted in a ring buffer per user. Every ``flush_interval``
+    seconds the counts are added to the ``usage_minute``, ``usage_hour`` and
+    ``usage_day`` tables at once, so the downsampled series never have to
+    be recomputed from raw rows. Every table keeps ``retention[name]``
+    seconds of history. A minute that is still unflushed when the ring wraps
+    around to it again is lost. Rings of users without requests since the
+    last flush are dropped.
+    """
+
+    def __init__(self, db, slots=15, flush_interval=10.0, max_points=1440,
+                 retention=None):
+        self.db = db
+        self.slots = slots
+        self.flush_interval = flush_interval
+        self.max_points = max_points
+        self.retention = retention or {'minute': 2 * 86400, 'hour': 90 * 86400, 'day': 730 * 86400}
+        self.app = None
+        self._rings = {}
+        self._backlog = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pruned = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.slots = app.config.get('USAGE_SERIES_SLOTS', self.slots)
+        self.flush_interval = app.config.get('USAGE_SERIES_FLUSH_INTERVAL', self.flush_interval)
+        for name in RESOLUTIONS:
+            days = app.config.get(f'USAGE_{name.upper()}_RETENTION_DAYS')
+            if days is not None:
+                self.retention[name] = days * 86400
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, count=1, now=None):
+        minute = int((time.time() if now is None else now) // 60)
+        with self._lock:
+            ring = self._rings.get(user_id)
+            if ring is None:
+                ring = self._rings[user_id] = _Ring(self.slots)
+            index = minute % len(ring.counts)
+            if ring.minutes[index] != minute:
+                ring.minutes[index] = minute
+                ring.counts[index] = 0
+            ring.counts[index] += count
+        self._ensure_thread()
+
+    def flush(self):
+        """Add the buffered counts to the rollup tables. Returns the number of (user, minute) counts written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._backlog = self._backlog, {}
+                for user_id, ring in list(self._rings.items()):
+                    if not any(ring.counts):
+                        del self._rings[user_id]
+                        continue
+                    for index, count in enumerate(ring.counts):
+                        if count:
+                            key = (user_id, ring.minutes[index])
+                            pending[key] = pending.get(key, 0) + count
+                            ring.counts[index] = 0
+            if not pending:
+                return 0
+            try:
+                with self.app.app_context(), self.db.engine.begin() as connection:
+                    for name, step in RESOLUTIONS.items():
+                        buckets = {}
+                        for (user_id, minute), count in pending.items():
+                            key = (user_id, minute * 60 // step * step)
+                            buckets[key] = buckets.get(key, 0) + count
+                        connection.execute(text(f"""
+                            INSERT INTO usage_{name} (user_id, bucket, count) VALUES (:user_id, :bucket, :count)
+                            ON CONFLICT (user_id, bucket) DO UPDATE SET count = count + excluded.count
+                        """), [{'user_id': user_id, 'bucket': bucket, 'count': count}
+                               for (user_id, bucket), count in buckets.items()])
+                    self._prune(connection)
+            except Exception as e:
+                print(e)
+                with self._lock:
+                    for key, count in pending.items():
+                        self._backlog[key] = self._backlog.get(key, 0) + count
+                return 0
+            return len(pending)
+
+    def resolution(self, start, end, now=None):
+        """The finest resolution that still has data for ``start`` and fits ``end - start`` in max_points."""
+        now = time.time() if now is None else now
+        for name, step in RESOLUTIONS.items():
+            if (end - start) / step <= self.max_points and start >= now - self.retention[name]:
+                return name
+        return 'day'
+
+    def query(self, user_id, start, end, resolution):
+        """Return ``[bucket, count]`` for every bucket from ``start`` up to ``end``, with zeros for the gaps.
+
+        Counts this process has not flushed yet are added to the stored ones.
+        """
+        step = RESOLUTIONS[resolution]
+        start = int(start) // step * step
+        with self.app.app_context(), self.db.engine.connect() as connection:
+            counts = dict(connection.execute(text(f"""
+                SELECT bucket, count FROM usage_{resolution}
+                WHERE user_id = :user_id AND bucket >= :start AND bucket < :end
+            """), {'user_id': user_id, 'start': start, 'end': end}).all())
+        for minute, count in self._pending(user_id):
+            bucket = minute * 60 // step * step
+            if start <= bucket < end:
+                counts[bucket] = counts.get(bucket, 0) + count
+        return [[bucket, counts.get(bucket, 0)] for bucket in range(start, int(end), step)]
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+    def _pending(self, user_id):
+        with self._lock:
+            pending = [(minute, count) for (owner, minute), count in self._backlog.items() if owner == user_id]
+            ring = self._rings.get(user_id)
+            if ring is not None:
+                pending.extend((ring.minutes[index], count) for index, count in enumerate(ring.counts) if count)
+        return pending
+
+    def _prune(self, connection):
+        now = time.time()
+        if now - self._pruned < 3600:
+            return
+        self._pruned = now
+        for name in RESOLUTIONS:
+            connection.execute(text(f"DELETE FROM usage_{name} WHERE bucket < :before"),
+                               {'before': now - self.retention[name]})
+
+    def _ensure_thread(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='usage-series-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
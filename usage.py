@@ -0,0 +1,98 @@
+import atexit
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, update
+
+
+class UsageCounter:
+    """Write-behind accumulator for API usage statistics.
+
+    Requests only bump an in-memory counter per user id (not per API key,
+    which may be rotated before the counts are written); the pending deltas
+    are written to ``user_info`` in a single bulk UPDATE once
+    ``flush_threshold`` requests have been buffered, every
+    ``flush_interval`` seconds and on interpreter shutdown.
+    """
+
+    def __init__(self, db, model, flush_interval=5.0, flush_threshold=100):
+        self.db = db
+        self.model = model
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.app = None
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('USAGE_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('USAGE_FLUSH_THRESHOLD', self.flush_threshold)
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, flush=True):
+        """Count one request of the user. With ``flush=False`` a full buffer is left to the flush thread."""
+        with self._lock:
+            count, _ = self._pending.get(user_id, (0, None))
+            self._pending[user_id] = (count + 1, datetime.now())
+            self._pending_count += 1
+            full = self._pending_count >= self.flush_threshold
+        if full and flush:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+        if not pending:
+            return 0
+
+        table = self.model.__table__
+        stmt = (
+            update(table)
+            .where(table.c.user_id == bindparam('user'))
+            .values(total_requests=func.coalesce(table.c.total_requests, 0) + bindparam('count'),
+                    last_request_timestamp=bindparam('timestamp'))
+        )
+        rows = [{'user': user_id, 'count': count, 'timestamp': timestamp}
+                for user_id, (count, timestamp) in pending.items()]
+        try:
+            with self._flush_lock, self.app.app_context():
+                with self.db.engine.begin() as connection:
+                    connection.execute(stmt, rows)
+        except Exception as e:
+            print(e)
+            self._restore(pending)
+            return 0
+        return len(rows)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, (count, timestamp) in pending.items():
+                current, newer = self._pending.get(key, (0, None))
+                self._pending[key] = (current + count, newer or timestamp)
+                self._pending_count += count
+
+    def _ensure_thread(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='usage-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()